@@ -0,0 +1,54 @@
+"""Run any of the scraper's commands, e.g. `python -m scraper pipeline --help`.
+
+Each command is a module of this package, which is only imported once the command is
+chosen. So a command only pays to import what it uses (e.g. selenium for the scrapers,
+numpy and scipy for similarity), and listing the commands imports nothing at all.
+"""
+import argparse
+import runpy
+import sys
+
+COMMANDS: dict[str, tuple[str, str]] = {
+    "pipeline": ("pipeline", "Crawl, fetch, and load reviews at once."),
+    "pages": ("get_pages", "Save review urls from each page."),
+    "reviews": ("get_reviews_from_pages", "Use the saved page data to obtain reviews."),
+    "sqlite": ("make_sqlite", "Use the saved review data to build the SQLite db."),
+    "schema": ("schema", "Build and test the dbt models without dbt."),
+    "spot-check": ("spot_check", "Run spot checks on review body content."),
+    "similarity": ("similarity", "Build and query a TF-IDF index over review bodies."),
+    "serve": ("serve", "Serve lookups against the SQLite db as JSON over HTTP."),
+    "open": ("open_html", "Open a saved review in the browser, for debugging."),
+    "replay-server": ("replay_server", "Serve a local stand-in for pitchfork.com."),
+    "load-test": ("load_test", "Load test the scrapers against a replay server."),
+    "profile-fetch": ("profile_fetch", "Compare page loads with and without --lean."),
+    "benchmark-views": ("benchmark_views", "Benchmark queries against the views."),
+    "benchmark-imports": ("benchmark_imports", "Benchmark each command's import time."),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command, leaving its arguments to the command."""
+    parser = argparse.ArgumentParser(
+        prog="python -m scraper",
+        description=__doc__,
+        epilog="commands:\n"
+        + "\n".join(f"  {name:<20}{help_}" for name, (_, help_) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "command", choices=COMMANDS, metavar="command", help="The command to run."
+    )
+    parser.add_argument(
+        "args", nargs=argparse.REMAINDER, help="Arguments for the command."
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    module, _ = COMMANDS[args.command]
+
+    # run the module as if by `python -m scraper.<module>`, so it parses its own args.
+    sys.argv = [sys.argv[0], *args.args]
+    runpy.run_module(f"scraper.{module}", run_name="__main__", alter_sys=True)
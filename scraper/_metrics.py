@@ -0,0 +1,141 @@
+"""Scraper telemetry: counters and latency histograms, exported as JSONL."""
+import datetime
+import json
+import math
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS: tuple[float, ...] = (0.5, 1, 2, 5, 10, 20, 30, 60, math.inf)
+
+
+class Histogram:
+    """A bucketed histogram, which keeps counts rather than every value."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """Start with empty buckets."""
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """Add a value to the histogram."""
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[idx] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        """Get the histogram as a json-able dict."""
+        return dict(
+            buckets={str(b): c for b, c in zip(self.buckets, self.counts)},
+            count=self.count,
+            sum=self.sum,
+            mean=self.sum / self.count if self.count else None,
+            max=self.max,
+            p50=self.quantile(0.5),
+            p90=self.quantile(0.9),
+            p99=self.quantile(0.99),
+        )
+
+
+class Metrics:
+    """Thread-safe counters and histograms, written periodically to a JSONL file.
+
+    Each line of the file is a snapshot of all metrics since the start of the run.
+    Without a path, metrics are only kept in memory for the summary. Use as a context
+    manager to write a final snapshot and print the summary at exit.
+    """
+
+    def __init__(self, path: Optional[Path] = None, interval: float = 60.0) -> None:
+        """Start the clock."""
+        self.path = path
+        self.interval = interval
+        self.lock = threading.RLock()  # reentrant, as write takes a snapshot.
+        self.counters: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.started_at = time.monotonic()
+        self.written_at = time.monotonic()
+
+    def __enter__(self) -> "Metrics":
+        return self
+
+    def __exit__(self, *exc):
+        self.write()
+        print(self.summary())
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+        self.maybe_write()
+
+    def observe(self, name: str, value: float):
+        """Add a value to a histogram."""
+        with self.lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+        self.maybe_write()
+
+    def snapshot(self) -> dict:
+        """Get all metrics as a json-able dict."""
+        with self.lock:
+            minutes = (time.monotonic() - self.started_at) / 60
+            return dict(
+                ts_utc=datetime.datetime.utcnow().isoformat(),
+                elapsed_minutes=minutes,
+                counters=dict(self.counters),
+                per_minute={k: v / minutes for k, v in self.counters.items()},
+                histograms={k: v.to_dict() for k, v in self.histograms.items()},
+            )
+
+    def maybe_write(self):
+        """Write a snapshot if the interval has passed since the last one."""
+        if self.path is None or time.monotonic() - self.written_at < self.interval:
+            return
+        with self.lock:
+            # another thread may have written while this one waited for the lock.
+            if time.monotonic() - self.written_at >= self.interval:
+                self.write()
+
+    def write(self):
+        """Append a snapshot to the metrics file."""
+        with self.lock:
+            self.written_at = time.monotonic()
+            if self.path is None:
+                return
+            line = json.dumps(self.snapshot())
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+    def summary(self) -> str:
+        """Get a human readable summary of the metrics."""
+        snapshot = self.snapshot()
+        lines = [f"Metrics after {snapshot['elapsed_minutes']:.1f} minutes:"]
+        for name, value in sorted(snapshot["counters"].items()):
+            per_minute = snapshot["per_minute"][name]
+            lines.append(f"    {name}: {value} ({per_minute:.2f}/min)")
+        for name, hist in sorted(snapshot["histograms"].items()):
+            lines.append(
+                f"    {name}: n={hist['count']} mean={hist['mean']:.2f}"
+                + f" p50<={hist['p50']:.2f} p90<={hist['p90']:.2f}"
+                + f" p99<={hist['p99']:.2f} max={hist['max']:.2f}"
+            )
+        return "\n".join(lines)
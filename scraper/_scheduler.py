@@ -0,0 +1,141 @@
+"""Adaptive request scheduling shared by the scrapers."""
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+from typing import Generator
+
+# one request per DEFAULT_TIMEOUT, as the scrapers did before this was adaptive.
+DEFAULT_RATE: float = 0.2
+DEFAULT_MIN_RATE: float = 0.05
+DEFAULT_MAX_RATE: float = 2.0
+DEFAULT_SLOW_SECONDS: float = 10.0
+
+
+class RateController:
+    """A token bucket request rate and AIMD concurrency limit, shared across threads.
+
+    Every successful fetch additively increases the rate and the concurrency limit, up to
+    their maximums. Every error, or fetch slower than slow_seconds, multiplicatively
+    decreases them. So the scrapers ramp up while the site is healthy, and back off as
+    soon as it is not.
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        min_rate: float = DEFAULT_MIN_RATE,
+        max_rate: float = DEFAULT_MAX_RATE,
+        max_concurrency: int = 1,
+        slow_seconds: float = DEFAULT_SLOW_SECONDS,
+        increase: float = None,
+        decrease: float = 0.5,
+        log_seconds: float = 60.0,
+        print_: bool = True,
+    ) -> None:
+        """Store settings and start with a full bucket."""
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = 1.0
+        self.max_concurrency = max_concurrency
+        self.slow_seconds = slow_seconds
+        # by default, go from nothing to max_rate in 100 successful fetches.
+        self.increase = increase or max_rate / 100
+        self.decrease = decrease
+        self.log_seconds = log_seconds
+        self.print_ = print_
+
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.tokens = 1.0
+        self.refilled_at = time.monotonic()
+        self.logged_at = time.monotonic()
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, **kwargs) -> "RateController":
+        """Make a controller from the arguments added by add_args."""
+        return cls(
+            rate=args.rate,
+            min_rate=args.min_rate,
+            max_rate=args.max_rate,
+            slow_seconds=args.slow_seconds,
+            **kwargs,
+        )
+
+    @staticmethod
+    def add_args(parser: argparse.ArgumentParser):
+        """Add arguments to configure the controller to a parser."""
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=DEFAULT_RATE,
+            help="Initial requests per second.",
+        )
+        parser.add_argument(
+            "--min-rate",
+            type=float,
+            default=DEFAULT_MIN_RATE,
+            help="Requests per second never to go below when backing off.",
+        )
+        parser.add_argument(
+            "--max-rate",
+            type=float,
+            default=DEFAULT_MAX_RATE,
+            help="Requests per second never to exceed when ramping up.",
+        )
+        parser.add_argument(
+            "--slow-seconds",
+            type=float,
+            default=DEFAULT_SLOW_SECONDS,
+            help="Fetches slower than this are treated like errors.",
+        )
+
+    @contextmanager
+    def slot(self) -> Generator[None, None, None]:
+        """Hold one of the concurrent fetch slots."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def wait_for_token(self):
+        """Block until the rate allows another request."""
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                self.tokens = min(
+                    1.0, self.tokens + (now - self.refilled_at) * self.rate
+                )
+                self.refilled_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def record(self, success: bool, seconds: float):
+        """Adjust the rate and concurrency given the outcome of a fetch."""
+        with self.condition:
+            if success and seconds <= self.slow_seconds:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.concurrency = min(
+                    self.max_concurrency, self.concurrency + 1 / self.concurrency
+                )
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.concurrency = max(1.0, self.concurrency * self.decrease)
+            self.condition.notify_all()
+
+            now = time.monotonic()
+            if self.print_ and now - self.logged_at >= self.log_seconds:
+                self.logged_at = now
+                print(
+                    f"Rate: {self.rate:.2f}/s, concurrency: {int(self.concurrency)},"
+                    + f" in flight: {self.in_flight}"
+                )
@@ -1,20 +1,53 @@
 import datetime
+import json
+import sqlite3
 import subprocess
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
 import sys
-from selenium import webdriver
-from selenium.webdriver.common.by import By
 
+from ._metrics import Metrics
+from ._scheduler import RateController
+
+if TYPE_CHECKING:
+    # selenium and psutil are slow to import, so are imported only where used.
+    from selenium import webdriver
+
+BASE_URL: str = "https://pitchfork.com"
 DEFAULT_RETRIES: int = 50
 DEFAULT_TIMEOUT: float = 5.0
+DEFAULT_MAX_NAVIGATIONS: int = 1000
+DEFAULT_MAX_RSS_MB: float = 2048.0
+DEFAULT_MAX_TIMEOUTS: int = 10
 PAGES_SAVE_PATH: Path = Path("_data/pages/")
 REVIEWS_SAVE_PATH: Path = Path("_data/reviews/")
 SQLITE_SAVE_PATH: Path = Path("_data/data.sqlite3")
+TFIDF_SAVE_PATH: Path = Path("_data/tfidf/")
+PIPELINE_CHECKPOINT_PATH: Path = Path("_data/pipeline.json")
+CHANGED_REVIEWS_PATH: Path = Path("_data/changed_reviews.txt")
 DBT_PATH: Path = Path("dbt")
 FIRST_BEST_NEW_MUSIC: datetime.datetime = datetime.datetime(2003, 1, 15)
 FIRST_BEST_NEW_REISSUE: datetime.datetime = datetime.datetime(2009, 1, 8)
 
+# the lean profile resolves no hosts other than these, which blocks third party content.
+LEAN_ALLOWED_HOSTS: tuple[str, ...] = (
+    "pitchfork.com",
+    "*.pitchfork.com",
+    "localhost",
+    "127.0.0.1",
+)
+# and blocks these url patterns on the allowed hosts.
+LEAN_BLOCKED_URLS: tuple[str, ...] = tuple(
+    f"*.{ext}*"
+    for ext in (
+        *("jpg", "jpeg", "png", "gif", "webp", "avif", "svg", "ico"),
+        *("woff", "woff2", "ttf", "otf", "eot"),
+        *("mp4", "webm", "mp3", "m4a", "m3u8"),
+    )
+)
+
 
 def dbt(*args):
     """Execute a dbt command in the project."""
@@ -23,58 +56,245 @@ def dbt(*args):
     )
 
 
+def review_filename(out: Path, url: str) -> Path:
+    """Get the path at which to save a review."""
+    return out / f"""{url.replace('/', '__').strip('_')}.json.gz"""
+
+
+def insert_many(
+    db: sqlite3.Connection,
+    table_name: str,
+    cols: list[str],
+    vals: list[tuple[Any]],
+    integrity_handler: str = "raise",
+):
+    """Wrapper around executemany for arbitrary tables."""
+    assert integrity_handler in ("ignore", "raise", "warn")
+    col_sql = ", ".join(map(lambda x: f'"{x}"', cols))
+    qs_sql = ", ".join(["?"] * len(cols))
+
+    assert all(len(i) == len(cols) for i in vals)
+
+    sql = f"""
+        insert into "{table_name}" ({col_sql}) 
+        values ({qs_sql})
+    """
+    if integrity_handler == "ignore":
+        sql += "\n on conflict do nothing"
+
+    try:
+        db.executemany(sql, vals)
+    except sqlite3.IntegrityError:
+        if integrity_handler == "warn":
+            print(f"Warning: Integrity error ignored on {table_name}.")
+        else:
+            raise
+
+
 class DriverContext:
-    """Context manager for a driver session."""
+    """Context manager for a driver session.
+
+    Requests are paced by the controller, which may be shared with other contexts to
+    enforce a global rate and concurrency across threads.
+
+    The browser is recycled (quit and replaced) after max_navigations page loads, when
+    the browser's memory exceeds max_rss_mb, or after max_timeouts consecutive failed
+    selector waits. A spare browser is launched in the background so that the swap does
+    not stall the scrape.
+    """
 
     def __init__(
-        self, headless: bool = False, wait_seconds: float = None, print_: bool = True
+        self,
+        headless: bool = False,
+        wait_seconds: float = None,
+        print_: bool = True,
+        max_navigations: int = DEFAULT_MAX_NAVIGATIONS,
+        max_rss_mb: float = DEFAULT_MAX_RSS_MB,
+        max_timeouts: int = DEFAULT_MAX_TIMEOUTS,
+        spare: bool = True,
+        lean: bool = False,
+        measure: bool = False,
+        controller: RateController = None,
+        metrics: Metrics = None,
     ) -> None:
         """Store settings for the context."""
         self.headless = headless
         self.wait_seconds = wait_seconds or DEFAULT_TIMEOUT
         self.print_ = print_
+        self.max_navigations = max_navigations
+        self.max_rss_mb = max_rss_mb
+        self.max_timeouts = max_timeouts
+        self.use_spare = spare
+        self.lean = lean
+        self.measure = measure
+        self.controller = controller or RateController(print_=print_)
+        self.metrics = metrics or Metrics()
+
+    def launch(self) -> "webdriver.Chrome":
+        """Launch a new browser."""
+        from selenium import webdriver
 
-    def __enter__(self) -> webdriver.Chrome:
-        """Create a driver session."""
         options = webdriver.ChromeOptions()
         options.add_argument("window-size=900x600")
         if self.headless:
             options.add_argument("headless")
 
-        self.driver = webdriver.Chrome(options=options)
-        self.driver.implicitly_wait(self.wait_seconds)
+        if self.lean:
+            # return from get() at DOMContentLoaded; the selector wait does the rest.
+            options.page_load_strategy = "eager"
+            options.add_argument("blink-settings=imagesEnabled=false")
+            options.add_argument(
+                "host-resolver-rules=MAP * ~NOTFOUND, "
+                + ", ".join(f"EXCLUDE {host}" for host in LEAN_ALLOWED_HOSTS)
+            )
+
+        if self.measure:
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+        driver = webdriver.Chrome(options=options)
+        driver.implicitly_wait(self.wait_seconds)
+
+        if self.lean:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": list(LEAN_BLOCKED_URLS)}
+            )
 
-        # self.console = Console()
+        return driver
+
+    def __enter__(self) -> "DriverContext":
+        """Create a driver session."""
+        # one worker, so quitting old browsers and launching spares never overlap.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.driver = self.launch()
+        self.spare: Optional[Future] = None
+        if self.use_spare:
+            self.spare = self.executor.submit(self.launch)
+        self.navigations = 0
+        self.timeouts = 0
         return self
 
     def __exit__(self, *exc):
         """Make sure we always quit at end."""
-        self.driver.quit()
+        try:
+            self.driver.quit()
+            # a spare which failed to launch has nothing to quit.
+            if self.spare is not None and self.spare.exception() is None:
+                self.spare.result().quit()
+        finally:
+            self.executor.shutdown()
+
+    def get_rss_mb(self) -> float:
+        """Get the memory used by the browser and all of its processes."""
+        import psutil
+
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            processes = [process, *process.children(recursive=True)]
+            return sum(p.memory_info().rss for p in processes) / 1024**2
+        except psutil.Error:
+            return 0.0
+
+    def recycle_reason(self) -> Optional[str]:
+        """Get the reason the browser should be recycled, if it should be."""
+        if self.navigations >= self.max_navigations:
+            return f"{self.navigations} navigations"
+        if self.timeouts >= self.max_timeouts:
+            return f"{self.timeouts} consecutive timeouts"
+        rss_mb = self.get_rss_mb()
+        if rss_mb >= self.max_rss_mb:
+            return f"{rss_mb:.0f}MB rss"
+        return None
+
+    def take_spare(self) -> "webdriver.Chrome":
+        """Get the spare browser, or launch one now if there's none or it failed."""
+        spare, self.spare = self.spare, None
+        if spare is not None:
+            try:
+                return spare.result()
+            except Exception as e:
+                if self.print_:
+                    print(f"Spare browser failed to launch: {str(e)}, launching...")
+                self.metrics.count("spare_failures")
+        return self.launch()
+
+    def recycle(self, reason: str):
+        """Swap the browser for the spare, and launch a new spare in the background."""
+        if self.print_:
+            print(f"Recycling browser after {reason}...")
+        self.metrics.count("browser_recycles")
+
+        old = self.driver
+        self.driver = self.take_spare()
+        self.executor.submit(old.quit)
+        if self.use_spare:
+            self.spare = self.executor.submit(self.launch)
+
+        self.navigations = 0
+        self.timeouts = 0
+
+    def pop_transferred_bytes(self) -> int:
+        """Get bytes transferred since the last call; requires measure=True."""
+        total = 0
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            if message["method"] == "Network.loadingFinished":
+                total += message["params"]["encodedDataLength"]
+        return total
+
+    def navigate(self, url: str):
+        """Go to a url, first recycling the browser if needed."""
+        reason = self.recycle_reason()
+        if reason is not None:
+            self.recycle(reason)
+        self.driver.get(url)
+        self.navigations += 1
 
     def get_with_retries(self, url: str, selector: str, retries: int = None) -> str:
         f"""Get a URL and return the source html.
 
         Wraps with many reties and requires the user to provide a wait css selector.
         Retries the GET request every 5 failed CSS checks, and waits {DEFAULT_TIMEOUT}
-        seconds between checks.
+        seconds between checks. Requests are paced by the rate controller, which is
+        told the outcome of each navigation.
         """
+        from selenium.common.exceptions import NoSuchElementException, TimeoutException
+        from selenium.webdriver.common.by import By
+
         retries = retries or DEFAULT_RETRIES
         if self.print_:
             print(f"Getting {url}...")
 
-        for i in range(retries):
-            try:
-                if i % 5 == 0:
-                    self.driver.get(url)
-                    time.sleep(DEFAULT_TIMEOUT)
-                self.driver.find_element(By.CSS_SELECTOR, selector)
-                break
-            except Exception as e:
-                if i == (retries - 1):
-                    raise
-                else:
-                    if self.print_:
-                        print(f"Excepted on {url}: {str(e)}, retrying...")
-                    time.sleep(DEFAULT_TIMEOUT)
-
-        return self.driver.page_source
+        with self.controller.slot():
+            fetch_start = time.monotonic()
+            for i in range(retries):
+                try:
+                    if i % 5 == 0:
+                        self.controller.wait_for_token()
+                        start = time.monotonic()
+                        self.navigate(url)
+                        self.metrics.count("requests")
+                    self.driver.find_element(By.CSS_SELECTOR, selector)
+                    self.controller.record(True, time.monotonic() - start)
+                    self.metrics.observe("selector_seconds", time.monotonic() - start)
+                    self.timeouts = 0
+                    break
+                except Exception as e:
+                    # one outcome per navigation, so that is what gets backed off.
+                    if i % 5 == 4 or i == (retries - 1):
+                        self.controller.record(False, time.monotonic() - start)
+                    self.metrics.count(f"exceptions.{type(e).__name__}")
+                    # other errors (e.g. refused connections) are the site's, not the
+                    # browser's, so a new browser wouldn't help.
+                    if isinstance(e, (NoSuchElementException, TimeoutException)):
+                        self.timeouts += 1
+                    if i == (retries - 1):
+                        raise
+                    else:
+                        if self.print_:
+                            print(f"Excepted on {url}: {str(e)}, retrying...")
+                        self.metrics.count("retries")
+                        time.sleep(DEFAULT_TIMEOUT)
+
+            self.metrics.observe("fetch_seconds", time.monotonic() - fetch_start)
+            return self.driver.page_source
@@ -0,0 +1,120 @@
+"""Benchmark how long each module of the scraper takes to import.
+
+Each module is imported in a fresh interpreter with `python -X importtime`, --repeat
+times, and the median is reported along with the slowest packages the module imported
+directly. Every command and every worker process pays this on start.
+
+Use --max-ms to fail if any module is slower than a budget, e.g. to catch a heavy
+dependency creeping back into a module that does not need it.
+"""
+import argparse
+import pkgutil
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def get_modules() -> list[str]:
+    """Get the names of the modules in this package."""
+    return sorted(
+        info.name
+        for info in pkgutil.iter_modules([str(Path(__file__).parent)])
+        if info.name != "__main__"
+    )
+
+
+def get_import_times(module: str) -> dict[str, float]:
+    """Import a module in a new interpreter, and get the ms spent on it and its deps.
+
+    Returns the cumulative ms for the module itself under its own name, and for each
+    package imported directly by the scraper's code under the package's name.
+    """
+    name = f"scraper.{module}"
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {name}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # imports are logged after their own imports, so the parent of a line is the
+    # closest later line that is one level shallower.
+    times = defaultdict(float)
+    parents: dict[int, str] = {}
+    for line in reversed(process.stderr.splitlines()):
+        match = IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        ms = int(match.group(1)) / 1000
+        depth = len(match.group(2)) // 2
+        imported = match.group(3)
+        parents[depth] = imported
+
+        parent = parents.get(depth - 1, "") if depth else ""
+        if imported == name:
+            times[name] = ms
+        elif parent.startswith("scraper") and not imported.startswith("scraper"):
+            times[imported.split(".")[0]] += ms
+
+    return dict(times)
+
+
+def run(modules: list[str], repeat: int) -> dict[str, dict[str, float]]:
+    """Get the median import times of each module over repeat runs."""
+    results = {}
+    for module in modules:
+        runs = [get_import_times(module) for _ in range(repeat)]
+        names = {name for times in runs for name in times}
+        results[module] = {
+            name: statistics.median(times.get(name, 0.0) for times in runs)
+            for name in names
+        }
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        help="Modules to benchmark, e.g. make_sqlite. Defaults to all of them.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Times to import each module."
+    )
+    parser.add_argument(
+        "--top", type=int, default=3, help="Number of slowest dependencies to show."
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="Option to fail if any module takes longer than this to import.",
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    modules = args.modules or get_modules()
+    results = run(modules, repeat=args.repeat)
+
+    slow = []
+    for module, times in sorted(
+        results.items(), key=lambda x: -x[1][f"scraper.{x[0]}"]
+    ):
+        total = times.pop(f"scraper.{module}")
+        if args.max_ms is not None and total > args.max_ms:
+            slow.append(module)
+        deps = sorted(times.items(), key=lambda x: -x[1])[: args.top]
+        print(f"{module}: {total:.1f}ms")
+        for name, ms in deps:
+            print(f"    {name}: {ms:.1f}ms")
+
+    assert not slow, f"Slower than {args.max_ms}ms to import: {', '.join(slow)}"
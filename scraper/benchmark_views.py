@@ -0,0 +1,298 @@
+"""Benchmark representative analytic queries against the views, and catch regressions.
+
+Each benchmark query is run against a built database (or a synthetic one, with
+--synthetic), recording its EXPLAIN QUERY PLAN and latency percentiles. Results are
+compared to a saved baseline: a new full table scan in a plan, or a median latency
+slower than the baseline by more than --tolerance, is a regression.
+
+Save a baseline with --save, then run without it after changing a model.
+"""
+import argparse
+import json
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from . import schema
+from ._utils import SQLITE_SAVE_PATH, insert_many
+
+BASELINE_PATH: Path = Path("_data/benchmark_baseline.json")
+
+# a full scan of a table (not a covering index), as reported by EXPLAIN QUERY PLAN.
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (?!.*USING (COVERING )?INDEX)")
+
+BENCHMARKS: dict[str, str] = {
+    "review_by_url": """
+        select * from reviews_flat
+        where review_url = (select max(review_url) from reviews)
+    """,
+    "reviews_by_artist": """
+        select * from reviews_flat
+        where review_url in (
+            select review_url from artist_review_map
+            where artist_id = (select max(artist_id) from artists)
+        )
+    """,
+    "recent_standard_reviews": """
+        select review_url, artists, title, score from standard_reviews_flat
+        order by pub_date desc limit 50
+    """,
+    "mean_score_by_release_year": """
+        select release_year, avg(score), count(*) from standard_reviews_flat
+        group by release_year
+    """,
+    "genre_scores": """
+        select genre_review_map.genre, avg(standard_reviews_flat.score), count(*)
+        from genre_review_map
+        inner join standard_reviews_flat
+            on genre_review_map.review_url = standard_reviews_flat.review_url
+        group by genre_review_map.genre
+    """,
+    "top_labels": """
+        select label_map.label, count(*), avg(tombstones.score)
+        from tombstone_label_map as label_map
+        inner join tombstones
+            on label_map.review_tombstone_id = tombstones.review_tombstone_id
+        group by label_map.label
+        order by count(*) desc limit 20
+    """,
+    "best_new_music_by_author": """
+        select author_review_map.author, sum(tombstones.best_new_music), count(*)
+        from author_review_map
+        inner join tombstones
+            on author_review_map.review_url = tombstones.review_url
+        group by author_review_map.author
+    """,
+}
+
+
+def make_synthetic(db: sqlite3.Connection, n_reviews: int, seed: int = 0):
+    """Fill an empty schema with random data shaped roughly like the real thing."""
+    rand = random.Random(seed)
+    genres = ["Rock", "Electronic", "Rap", "Experimental", "Pop/R&B", "Folk/Country"]
+    artists = [
+        (f"artist-{i}", f"Artist {i}", f"/artists/artist-{i}/")
+        for i in range(n_reviews // 3 + 1)
+    ]
+    insert_many(db, "artists", ["artist_id", "name", "artist_url"], artists)
+
+    for i in range(n_reviews):
+        url = f"/reviews/albums/{i}-synthetic/"
+        pub_year = rand.randint(1999, 2021)
+        insert_many(
+            db,
+            "reviews",
+            ["review_url", "is_standard_review", "pub_date", "body"],
+            [(url, rand.random() < 0.9, f"{pub_year}-01-01 00:00:00", "word " * 500)],
+        )
+        insert_many(
+            db,
+            "artist_review_map",
+            ["review_url", "artist_id"],
+            [
+                (url, artist[0])
+                for artist in rand.sample(artists, rand.choice([1, 1, 2]))
+            ],
+        )
+        insert_many(
+            db,
+            "author_review_map",
+            ["review_url", "author"],
+            [(url, f"Author {rand.randint(0, 300)}")],
+        )
+        insert_many(
+            db,
+            "genre_review_map",
+            ["review_url", "genre"],
+            [(url, genre) for genre in rand.sample(genres, rand.choice([1, 1, 2]))],
+        )
+        for idx in range(rand.choice([1] * 9 + [2])):
+            tombstone_id = f"{url}-{idx}"
+            insert_many(
+                db,
+                "tombstones",
+                [
+                    "review_tombstone_id",
+                    "review_url",
+                    "picker_index",
+                    "title",
+                    "score",
+                    "best_new_music",
+                    "best_new_reissue",
+                ],
+                [
+                    (
+                        tombstone_id,
+                        url,
+                        idx,
+                        f"Title {i}",
+                        round(rand.uniform(0, 10), 1),
+                        rand.random() < 0.05,
+                        False,
+                    )
+                ],
+            )
+            insert_many(
+                db,
+                "tombstone_label_map",
+                ["review_tombstone_id", "label"],
+                [(tombstone_id, f"Label {rand.randint(0, 1000)}")],
+            )
+            insert_many(
+                db,
+                "tombstone_release_year_map",
+                ["review_tombstone_id", "release_year"],
+                [(tombstone_id, pub_year)],
+            )
+    db.commit()
+
+
+def get_plan(db: sqlite3.Connection, sql: str) -> list[str]:
+    """Get the EXPLAIN QUERY PLAN details of a query."""
+    return [row[3] for row in db.execute(f"explain query plan {sql}")]
+
+
+def get_latencies(db: sqlite3.Connection, sql: str, repeat: int) -> dict[str, float]:
+    """Run a query many times and get latency percentiles in milliseconds."""
+    db.execute(sql).fetchall()  # warm the page cache first.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute(sql).fetchall()
+        times.append((time.perf_counter() - start) * 1000)
+
+    percentiles = statistics.quantiles(times, n=100, method="inclusive")
+    return dict(p50=percentiles[49], p90=percentiles[89], p99=percentiles[98])
+
+
+def run(db: sqlite3.Connection, repeat: int = 20) -> dict[str, dict]:
+    """Run all benchmarks, returning {name: {plan, latency}}."""
+    results = {}
+    for name, sql in BENCHMARKS.items():
+        results[name] = dict(
+            plan=get_plan(db, sql), latency=get_latencies(db, sql, repeat)
+        )
+        print(
+            f"{name}: "
+            + ", ".join(f"{k}={v:.2f}ms" for k, v in results[name]["latency"].items())
+        )
+    return results
+
+
+def compare(
+    results: dict[str, dict],
+    baseline: dict[str, dict],
+    tolerance: float = 0.5,
+    min_ms: float = 1.0,
+) -> list[str]:
+    """Compare results to a baseline, returning a description of each regression."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: not in baseline, skipping.")
+            continue
+        base = baseline[name]
+
+        if result["plan"] != base["plan"]:
+            print(f"{name}: plan changed.")
+            print("    was: " + "\n         ".join(base["plan"]))
+            print("    now: " + "\n         ".join(result["plan"]))
+
+        new_scans = {i for i in result["plan"] if FULL_SCAN_PATTERN.match(i)}
+        new_scans -= {i for i in base["plan"] if FULL_SCAN_PATTERN.match(i)}
+        for detail in sorted(new_scans):
+            regressions.append(f"{name}: new full scan: {detail}")
+
+        now, was = result["latency"]["p50"], base["latency"]["p50"]
+        if now > was * (1 + tolerance) and now - was > min_ms:
+            regressions.append(f"{name}: p50 latency {was:.2f}ms -> {now:.2f}ms")
+
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--in",
+        dest="in_",
+        type=Path,
+        help="The path to the sqlite database.",
+        default=SQLITE_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        help="Option to benchmark a synthetic database with this many reviews.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="The path to the baseline results.",
+        default=BASELINE_PATH,
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="Option to save the results as the new baseline.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Times to run each query, at least 2."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed fractional increase in p50 latency over the baseline.",
+    )
+    args = parser.parse_args()
+    if args.repeat < 2:
+        parser.error("--repeat must be at least 2, to compute quantiles.")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.synthetic:
+            print(f"Building synthetic database with {args.synthetic} reviews...")
+            db = sqlite3.connect(Path(tmpdir) / "synthetic.sqlite3")
+            schema.build(db)
+            make_synthetic(db, args.synthetic)
+        else:
+            assert args.in_.exists()
+            db = sqlite3.connect(f"file:{args.in_}?mode=ro", uri=True)
+
+        results = run(db, repeat=args.repeat)
+        db.close()
+
+    # results are only comparable to a baseline measured the same way.
+    target = dict(
+        database=None if args.synthetic else str(args.in_),
+        synthetic=args.synthetic,
+        repeat=args.repeat,
+    )
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(
+            json.dumps(dict(target=target, results=results), indent=2)
+        )
+        print(f"Saved baseline to {args.baseline}.")
+    else:
+        assert args.baseline.exists(), f"No baseline at {args.baseline}; use --save."
+        baseline = json.loads(args.baseline.read_text())
+        assert baseline.get("target") == target, (
+            f"Baseline was measured against {baseline.get('target')}, not {target};"
+            + " rerun with matching arguments, or --save a new baseline."
+        )
+        regressions = compare(results, baseline["results"], tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        assert not regressions, f"{len(regressions)} regressions found."
+        print("No regressions!")
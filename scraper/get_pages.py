@@ -4,10 +4,13 @@ import datetime
 import json
 import shutil
 from pathlib import Path
+from typing import Generator
 
 from bs4 import BeautifulSoup
 
-from ._utils import PAGES_SAVE_PATH, DriverContext
+from ._metrics import Metrics
+from ._scheduler import RateController
+from ._utils import BASE_URL, PAGES_SAVE_PATH, DriverContext
 
 
 def is_last_page(soup: BeautifulSoup) -> bool:
@@ -15,10 +18,12 @@ def is_last_page(soup: BeautifulSoup) -> bool:
     return soup.find("div", {"class": "end-infinite"}) is not None
 
 
-def get_page_by_number(driver: DriverContext, number: int) -> BeautifulSoup:
+def get_page_by_number(
+    driver: DriverContext, number: int, base_url: str = BASE_URL
+) -> BeautifulSoup:
     """Get the page with the given number."""
     html = driver.get_with_retries(
-        url=f"https://pitchfork.com/reviews/albums/?page={number}",
+        url=f"{base_url}/reviews/albums/?page={number}",
         selector="#site-content",
     )
     assert "#site-content" in html  # catch weirdness
@@ -34,6 +39,55 @@ def get_reviews_from_page(source: BeautifulSoup) -> list[str]:
     return urls
 
 
+def iter_pages(
+    driver: DriverContext,
+    start: int = 1,
+    end: int = None,
+    base_url: str = BASE_URL,
+) -> Generator[tuple[int, list[str], bool], None, None]:
+    """Yield (page number, review urls, is last page) until the end or the last page."""
+    page_num = start
+    while True:
+        if end is not None and page_num > end:
+            print("End Reached!")
+            break
+
+        page = get_page_by_number(driver, page_num, base_url=base_url)
+        last = is_last_page(page)
+        driver.metrics.count("pages")
+        yield page_num, get_reviews_from_page(page), last
+
+        if last:
+            print("Last Page Reached!")
+            break
+        page_num += 1
+
+
+def save_page(out: Path, page_num: int, urls: list[str]):
+    """Save the review urls from a page to a JSON file."""
+    with open(out / f"{page_num}.json", "w") as f:
+        json.dump(
+            {
+                "page_scrape_ts_utc": datetime.datetime.utcnow().isoformat(),
+                "page": page_num,
+                "urls": urls,
+            },
+            f,
+        )
+
+
+def scrape_pages(
+    driver: DriverContext,
+    out: Path,
+    start: int = 1,
+    end: int = None,
+    base_url: str = BASE_URL,
+):
+    """Save the review urls on each page, until the end or the last page."""
+    for page_num, urls, _ in iter_pages(driver, start, end, base_url=base_url):
+        save_page(out, page_num, urls)
+
+
 def parse_args() -> argparse.Namespace:
     """Make the parser for the command line arguments."""
     parser = argparse.ArgumentParser(description="Get the album reviews pages.")
@@ -63,6 +117,22 @@ def parse_args() -> argparse.Namespace:
         help="Option to run the scraper headless",
         action="store_true",
     )
+    parser.add_argument(
+        "--lean",
+        help="Option to skip images, media, fonts and third party content.",
+        action="store_true",
+    )
+    RateController.add_args(parser)
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="Option to periodically append metrics to this JSONL file.",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="The site to scrape; e.g. a local replay server for testing.",
+        default=BASE_URL,
+    )
     parser.add_argument(
         "--append",
         help="Option to not delete the existing data.",
@@ -83,27 +153,9 @@ if __name__ == "__main__":
         shutil.rmtree(args.out, ignore_errors=True)
     args.out.mkdir(exist_ok=True)
 
-    page_num = args.start
-    with DriverContext(headless=args.headless) as driver:
-        while True:
-            if args.end is not None and page_num > args.end:
-                print("End Reached!")
-                break
-
-            page = get_page_by_number(driver, page_num)
-            urls = get_reviews_from_page(page)
-
-            with open(args.out / f"{page_num}.json", "w") as f:
-                json.dump(
-                    {
-                        "page_scrape_ts_utc": datetime.datetime.utcnow().isoformat(),
-                        "page": page_num,
-                        "urls": urls,
-                    },
-                    f,
-                )
-
-            if is_last_page(page):
-                print("Last Page Reached!")
-                break
-            page_num += 1
+    # pages are fetched one at a time, since the last page is only known on arrival.
+    controller = RateController.from_args(args)
+    with Metrics(args.metrics) as metrics, DriverContext(
+        headless=args.headless, lean=args.lean, controller=controller, metrics=metrics
+    ) as driver:
+        scrape_pages(driver, args.out, args.start, args.end, base_url=args.base_url)
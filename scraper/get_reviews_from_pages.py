@@ -2,24 +2,180 @@
 import argparse
 import datetime
 import gzip
+import hashlib
 import json
+import queue
+import random
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
-from ._utils import PAGES_SAVE_PATH, REVIEWS_SAVE_PATH, DriverContext
+from ._metrics import Metrics
+from ._scheduler import RateController
+from ._utils import (
+    BASE_URL,
+    CHANGED_REVIEWS_PATH,
+    PAGES_SAVE_PATH,
+    REVIEWS_SAVE_PATH,
+    DriverContext,
+    review_filename,
+)
 
-BASE_URL = "https://pitchfork.com"
+# attributes which carry content; the rest (ad slots, tracking, etc) vary between loads.
+CONTENT_HASH_ATTRS: tuple[str, ...] = ("class", "href", "datetime")
 
 
-def get_review_html(driver: DriverContext, path: str) -> str:
+def get_review_html(driver: DriverContext, path: str, base_url: str = BASE_URL) -> str:
     """Return the page bocy from the url"""
-    html = driver.get_with_retries(url=f"{BASE_URL}{path}", selector=".review-body")
+    html = driver.get_with_retries(url=f"{base_url}{path}", selector=".review-body")
     content = BeautifulSoup(html, "lxml").find("div", {"id": "site-content"})
     assert content is not None, "Could not find review body"
-    return str(content)
+    content = str(content)
+
+    # track how much of the page is thrown away.
+    driver.metrics.count("page_bytes", len(html.encode()))
+    driver.metrics.count("saved_bytes", len(content.encode()))
+    return content
+
+
+def content_hash(html: str) -> str:
+    """Hash the content of a review, ignoring markup that can change between loads.
+
+    Scripts, styles, and attributes other than CONTENT_HASH_ATTRS are dropped and
+    whitespace is collapsed, so the hash only changes when the review does.
+    """
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup.find_all(["script", "style", "noscript", "iframe"]):
+        tag.decompose()
+    for tag in soup.find_all(True):
+        tag.attrs = {k: v for k, v in tag.attrs.items() if k in CONTENT_HASH_ATTRS}
+    normalized = " ".join(str(soup).split())
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def save_review(filename: Path, url: str, html: str, digest: str = None):
+    """Save review data to a gzipped json file."""
+    review_data = dict(
+        url=url,
+        review_scrape_ts_utc=datetime.datetime.utcnow().isoformat(),
+        html=html,
+        content_hash=digest or content_hash(html),
+    )
+    with gzip.open(filename, "wb") as f:
+        f.write(json.dumps(review_data).encode())
+
+
+def saved_content_hash(filename: Path) -> Optional[str]:
+    """Get the content hash of a saved review, if there is one."""
+    if not filename.exists():
+        return None
+    with gzip.open(filename, "rb") as f:
+        review_data = json.load(f)
+    # files saved before hashing was added don't have one.
+    return review_data.get("content_hash") or content_hash(review_data["html"])
+
+
+def select_for_refresh(
+    urls: list[str],
+    out: Path,
+    older_than_days: float = None,
+    sample: float = 1.0,
+) -> list[str]:
+    """Select saved reviews to refresh, by days since last checked and at random.
+
+    A review's file is touched whenever it is checked, even if it has not changed, so
+    the file's mtime is when it was last checked.
+    """
+    now = time.time()
+    selected = []
+    for url in urls:
+        filename = review_filename(out, url)
+        if not filename.exists():
+            continue
+        if older_than_days is not None:
+            if now - filename.stat().st_mtime < older_than_days * 24 * 60 * 60:
+                continue
+        if random.random() < sample:
+            selected.append(url)
+    return selected
+
+
+def scrape_reviews(
+    urls: list[str],
+    out: Path,
+    controller: RateController,
+    metrics: Metrics,
+    workers: int = 1,
+    headless: bool = False,
+    lean: bool = False,
+    base_url: str = BASE_URL,
+    changed: Path = None,
+):
+    """Scrape and save reviews in worker threads, each with its own browser.
+
+    The controller is shared by all workers, so it decides how many are fetching at
+    once and how quickly.
+
+    If changed is given, reviews are only saved if their content hash differs from the
+    saved one, and the names of the files to be saved are appended to it first.
+    """
+    todo = queue.Queue()
+    for url in urls:
+        todo.put(url)
+    stop = threading.Event()
+    lock = threading.Lock()
+    progress = tqdm(total=len(urls))
+
+    def save_if_changed(filename: Path, url: str, html: str):
+        digest = content_hash(html)
+        if digest == saved_content_hash(filename):
+            filename.touch()  # checked, so not due for a refresh again yet.
+            metrics.count("unchanged_reviews")
+            return
+
+        # list it first, so a crash while saving can't leave it changed but unlisted.
+        with lock, open(changed, "a") as f:
+            f.write(filename.name + "\n")
+        save_review(filename, url, html, digest=digest)
+        metrics.count("changed_reviews")
+
+    def work():
+        with DriverContext(
+            headless=headless,
+            print_=False,
+            lean=lean,
+            controller=controller,
+            metrics=metrics,
+        ) as driver:
+            while not stop.is_set():
+                try:
+                    url = todo.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    html = get_review_html(driver, url, base_url=base_url)
+                    filename = review_filename(out, url)
+                    if changed is None:
+                        save_review(filename, url, html)
+                    else:
+                        save_if_changed(filename, url, html)
+                except Exception:
+                    stop.set()  # bring down the other workers too.
+                    raise
+                metrics.count("reviews")
+                progress.update()
+
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(work) for _ in range(workers)]
+    progress.close()
+    for future in futures:
+        future.result()
 
 
 def parse_args() -> argparse.Namespace:
@@ -46,6 +202,11 @@ def parse_args() -> argparse.Namespace:
         help="Option to run the scraper headless",
         action="store_true",
     )
+    parser.add_argument(
+        "--lean",
+        help="Option to skip images, media, fonts and third party content.",
+        action="store_true",
+    )
     parser.add_argument(
         "--append",
         help="Option to not delete the existing data.",
@@ -56,7 +217,51 @@ def parse_args() -> argparse.Namespace:
         help="Option to skip the scrape for review files already in --out.",
         action="store_true",
     )
+    parser.add_argument(
+        "--refresh",
+        help=(
+            "Option to fetch reviews already in --out again, but only save those whose"
+            + " content changed, listing them in --changed. Implies --append."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--refresh-older-than",
+        type=float,
+        help="Option to refresh only reviews last checked more than this many days ago.",
+    )
+    parser.add_argument(
+        "--refresh-sample",
+        type=float,
+        default=1.0,
+        help="Fraction of the reviews to refresh, chosen at random.",
+    )
+    parser.add_argument(
+        "--changed",
+        type=Path,
+        help="The path to list changed reviews in, for make_sqlite --changed-only.",
+        default=CHANGED_REVIEWS_PATH,
+    )
+    parser.add_argument(
+        "--base-url",
+        help="The site to scrape; e.g. a local replay server for testing.",
+        default=BASE_URL,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Max number of browsers to fetch with concurrently.",
+    )
+    RateController.add_args(parser)
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="Option to periodically append metrics to this JSONL file.",
+    )
     args = parser.parse_args()
+    if args.new_only and args.refresh:
+        parser.error("--refresh only fetches saved reviews, which --new-only skips.")
     return args
 
 
@@ -64,7 +269,7 @@ if __name__ == "__main__":
     args = parse_args()
 
     assert args.in_.exists()
-    if not args.append:
+    if not args.append and not args.refresh:
         shutil.rmtree(args.out, ignore_errors=True)
     args.out.mkdir(exist_ok=True)
 
@@ -74,19 +279,28 @@ if __name__ == "__main__":
         for url in json.loads(fpath.read_text())["urls"]
     ]
 
-    with DriverContext(headless=args.headless, print_=False) as driver:
-        for url in tqdm(urls):
-            filename = args.out / f"""{url.replace('/', '__').strip('_')}.json.gz"""
-
-            # skip if not new and not replacing
-            if args.new_only and filename.exists():
-                continue
+    # skip if not new and not replacing
+    if args.new_only:
+        urls = [url for url in urls if not review_filename(args.out, url).exists()]
 
-            review_data = dict(
-                url=url,
-                review_scrape_ts_utc=datetime.datetime.utcnow().isoformat(),
-                html=get_review_html(driver, url),
-            )
+    if args.refresh:
+        urls = select_for_refresh(
+            urls,
+            args.out,
+            older_than_days=args.refresh_older_than,
+            sample=args.refresh_sample,
+        )
+        print(f"Refreshing {len(urls)} reviews...")
 
-            with gzip.open(filename, "wb") as f:
-                f.write(json.dumps(review_data).encode())
+    with Metrics(args.metrics) as metrics:
+        scrape_reviews(
+            urls,
+            args.out,
+            controller=RateController.from_args(args, max_concurrency=args.workers),
+            metrics=metrics,
+            workers=args.workers,
+            headless=args.headless,
+            lean=args.lean,
+            base_url=args.base_url,
+            changed=args.changed if args.refresh else None,
+        )
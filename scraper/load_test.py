@@ -0,0 +1,108 @@
+"""Load test both scrapers end-to-end against a local replay server.
+
+Starts a replay server (synthetic by default), scrapes all of its listing pages and
+then all of its reviews into a temporary directory, and reports throughput and retry
+behaviour. Use --latency, --jitter, and --error-rate to see how the rate controller
+copes with a slow or failing site.
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from ._metrics import Metrics
+from ._scheduler import RateController
+from ._utils import DriverContext
+from .get_pages import scrape_pages
+from .get_reviews_from_pages import scrape_reviews
+from .replay_server import add_server_args, server_from_args
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_server_args(parser)
+    RateController.add_args(parser)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Max number of browsers to fetch reviews with concurrently.",
+    )
+    parser.add_argument(
+        "--headless",
+        help="Option to run the scraper headless",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lean",
+        help="Option to skip images, media, fonts and third party content.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="Option to periodically append metrics to this JSONL file.",
+    )
+    # no need to be polite to ourselves.
+    parser.set_defaults(synthetic=20, rate=5.0, max_rate=100.0)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    server = server_from_args(args)
+    server.start()
+    print(f"Replay server at {server.base_url}")
+
+    controller = RateController.from_args(args, max_concurrency=args.workers)
+    with tempfile.TemporaryDirectory() as tmpdir, Metrics(args.metrics) as metrics:
+        pages_path = Path(tmpdir) / "pages"
+        reviews_path = Path(tmpdir) / "reviews"
+        pages_path.mkdir()
+        reviews_path.mkdir()
+
+        start = time.perf_counter()
+        with DriverContext(
+            headless=args.headless,
+            print_=False,
+            lean=args.lean,
+            controller=controller,
+            metrics=metrics,
+        ) as driver:
+            scrape_pages(driver, pages_path, base_url=server.base_url)
+        pages_seconds = time.perf_counter() - start
+
+        urls = [
+            url
+            for fpath in pages_path.glob("*.json")
+            for url in json.loads(fpath.read_text())["urls"]
+        ]
+        start = time.perf_counter()
+        scrape_reviews(
+            urls,
+            reviews_path,
+            controller=controller,
+            metrics=metrics,
+            workers=args.workers,
+            headless=args.headless,
+            lean=args.lean,
+            base_url=server.base_url,
+        )
+        reviews_seconds = time.perf_counter() - start
+        n_reviews = len(list(reviews_path.glob("*.json.gz")))
+
+    server.shutdown()
+    print()
+    print(f"Pages: {server.archive.last_page} in {pages_seconds:.1f}s", end="")
+    print(f" ({server.archive.last_page / pages_seconds:.2f} pages/sec)")
+    print(f"Reviews: {n_reviews} in {reviews_seconds:.1f}s", end="")
+    print(f" ({n_reviews / reviews_seconds:.2f} reviews/sec)")
+    print(f"Retries: {metrics.counters.get('retries', 0)}")
+    print(
+        f"Final rate: {controller.rate:.2f}/s, concurrency: {controller.concurrency:.1f}"
+    )
+    print(f"Server: {server.stats}")
@@ -5,17 +5,20 @@ import json
 import multiprocessing
 import sqlite3
 from pathlib import Path
-from typing import Any, Generator, Iterable
+from typing import Generator, Iterable
 
 from tqdm import tqdm
 
 from ._utils import (
+    CHANGED_REVIEWS_PATH,
     FIRST_BEST_NEW_MUSIC,
     FIRST_BEST_NEW_REISSUE,
     REVIEWS_SAVE_PATH,
     SQLITE_SAVE_PATH,
     dbt,
+    insert_many,
 )
+from . import schema
 from .models import Review
 
 
@@ -30,7 +33,12 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--no-dbt",
         action="store_true",
-        help="Option to Skip DBT steps (assuming theyre run separately).",
+        help="Option to skip schema build and test steps (if theyre run separately).",
+    )
+    parser.add_argument(
+        "--dbt",
+        action="store_true",
+        help="Option to build and test the schema via dbt rather than in-process.",
     )
     parser.add_argument(
         "--in",
@@ -45,6 +53,20 @@ def parse_args() -> argparse.Namespace:
         help="The path to save the sqlite database.",
         default=SQLITE_SAVE_PATH,
     )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help=(
+            "Option to update an existing db with only the reviews listed in --changed,"
+            + " instead of building it from scratch."
+        ),
+    )
+    parser.add_argument(
+        "--changed",
+        type=Path,
+        help="The path to the list of changed reviews, from a --refresh scrape.",
+        default=CHANGED_REVIEWS_PATH,
+    )
     parser.add_argument(
         "--single", type=Path, help="Run only a single file. Useful for debugging."
     )
@@ -58,34 +80,40 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
-def insert_many(
-    db: sqlite3.Connection,
-    table_name: str,
-    cols: list[str],
-    vals: list[tuple[Any]],
-    integrity_handler: str = "raise",
-):
-    """Wrapper around executemany for arbitrary tables."""
-    assert integrity_handler in ("ignore", "raise", "warn")
-    col_sql = ", ".join(map(lambda x: f'"{x}"', cols))
-    qs_sql = ", ".join(["?"] * len(cols))
+def parse_review_file(fpath: Path) -> tuple[str, Review]:
+    """Parse a saved review file, returning its url and Review."""
+    with gzip.open(fpath, "rb") as f:
+        json_data = json.load(f)
+    try:
+        review = Review.from_html(json_data["html"])
+    except Exception:
+        print(f"Error parsing {fpath}")
+        raise
+    return json_data["url"], review
 
-    assert all(len(i) == len(cols) for i in vals)
 
-    sql = f"""
-        insert into "{table_name}" ({col_sql}) 
-        values ({qs_sql})
-    """
-    if integrity_handler == "ignore":
-        sql += "\n on conflict do nothing"
+def delete_review(db: sqlite3.Connection, review_url: str):
+    """Delete data from the db for a review, so that it can be inserted again.
 
-    try:
-        db.executemany(sql, vals)
-    except sqlite3.IntegrityError:
-        if integrity_handler == "warn":
-            print(f"Warning: Integrity error ignored on {table_name}.")
-        else:
-            raise
+    Artists are left in place, since other reviews may refer to them.
+    """
+    for table_name in ("tombstone_label_map", "tombstone_release_year_map"):
+        db.execute(
+            f"""
+            delete from "{table_name}" where review_tombstone_id in (
+                select review_tombstone_id from tombstones where review_url = ?
+            )
+            """,
+            (review_url,),
+        )
+    for table_name in (
+        "tombstones",
+        "artist_review_map",
+        "genre_review_map",
+        "author_review_map",
+        "reviews",
+    ):
+        db.execute(f'delete from "{table_name}" where review_url = ?', (review_url,))
 
 
 def insert_review(db: sqlite3.Connection, review_url: str, review: Review):
@@ -192,14 +220,23 @@ if __name__ == "__main__":
     else:
         assert args.in_.exists()
 
-    if args.out.exists() and not args.no_dbt:
-        args.out.unlink()
+    if args.changed_only:
+        assert args.out.exists(), "--changed-only needs an existing db to update."
+        names = set(args.changed.read_text().split()) if args.changed.exists() else ()
+        review_jsons = [args.in_ / name for name in sorted(names)]
+        print(f"Updating {len(review_jsons)} changed reviews.")
+    else:
+        review_jsons = (
+            tuple(args.in_.glob("*.json.gz")) if not args.single else [args.single]
+        )
 
-    review_jsons = (
-        tuple(args.in_.glob("*.json.gz")) if not args.single else [args.single]
-    )
+    # changes are loaded into the existing db, so there's no schema to build.
+    build = not args.no_dbt and not args.changed_only
 
-    if not args.no_dbt:
+    if args.out.exists() and build:
+        args.out.unlink()
+
+    if build and args.dbt:
         print("Executing DBT clean...")
         dbt("clean")
         print()
@@ -209,34 +246,45 @@ if __name__ == "__main__":
         dbt("run")
         print()
 
+    elif build:
+        print("Building schema...")
+        with sqlite3.connect(args.out) as db:
+            schema.build(db)
+        print()
+
     # shared across later lines. idc about closing it, this is sqlite.
     db = sqlite3.connect(args.out, timeout=10000, check_same_thread=False)
 
-    def f(fpath: Path) -> tuple[str, Review]:
-        with gzip.open(fpath, "rb") as f:
-            json_data = json.load(f)
-        try:
-            review = Review.from_html(json_data["html"])
-        except Exception:
-            print(f"Error parsing {fpath}")
-            raise
-        return json_data["url"], review
-
-    chunks = list(chunker(review_jsons, min(1000, len(review_jsons))))
+    chunks = list(chunker(review_jsons, min(1000, len(review_jsons)) or 1))
 
-    print(f"Inserting data in {len(chunks)} chunks of len={len(chunks[0])}")
+    if chunks:
+        print(f"Inserting data in {len(chunks)} chunks of len={len(chunks[0])}")
     with multiprocessing.Pool(args.procs) as pool:
         for chunk in tqdm(chunks):
-            results = pool.map(f, chunk)
+            results = pool.map(parse_review_file, chunk)
             for url, review in results:
+                if args.changed_only:
+                    delete_review(db, url)
                 insert_review(db, url, review)
 
     db.commit()
     db.close()
 
-    if not args.no_dbt:
+    # the changes are in, so they need not be loaded again. keep any listed since.
+    if args.changed_only and args.changed.exists():
+        remaining = set(args.changed.read_text().split()) - set(names)
+        args.changed.write_text("".join(f"{name}\n" for name in sorted(remaining)))
+
+    if not args.no_dbt and args.dbt:
         print("\nExecuting DBT test...")
         dbt("test")
         print()
 
+    elif not args.no_dbt:
+        print("\nTesting schema...")
+        with sqlite3.connect(args.out) as db:
+            failures = schema.test(db)
+        assert not failures, f"{len(failures)} tests failed."
+        print()
+
     print("All good!")
@@ -10,8 +10,6 @@ import tempfile
 import time
 from pathlib import Path
 
-from bs4 import BeautifulSoup
-
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -28,7 +26,6 @@ if __name__ == "__main__":
         html = json.load(f)["html"]
 
     with tempfile.NamedTemporaryFile(mode="w", suffix=".html") as f:
-        soup = BeautifulSoup(html, "lxml")
         f.write(html)
         subprocess.call(["firefox", f.name])
         time.sleep(1)
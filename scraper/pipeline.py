@@ -0,0 +1,316 @@
+"""Run the crawl, fetch, and load stages at once, streaming between them.
+
+Instead of waiting for each stage to finish before starting the next, listing pages
+are crawled in one thread, review urls are streamed through a bounded queue to fetch
+workers, and fetched files are streamed through another bounded queue to a loader which
+parses them in a process pool and inserts them into the database. So the database fills
+continuously and the total time is close to that of the slowest stage.
+
+Each stage checkpoints, so the pipeline can be stopped and resumed:
+
+- Crawl: pages are saved as they are crawled, and the last crawled page is recorded.
+  On resume, urls on the saved pages are requeued and the crawl continues from there.
+  Once a crawl has reached the last page, later runs crawl from the first page again
+  only until a page with no new reviews. New reviews push the rest down the pages, so
+  recrawled pages are not saved over the crawled ones; new urls are recorded in the
+  checkpoint instead.
+- Fetch: reviews already saved in --reviews are not fetched again.
+- Load: reviews already in the database are neither parsed nor inserted again.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import multiprocessing.pool
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tqdm import tqdm
+
+from . import schema
+from ._metrics import Metrics
+from ._scheduler import RateController
+from ._utils import (
+    BASE_URL,
+    PAGES_SAVE_PATH,
+    PIPELINE_CHECKPOINT_PATH,
+    REVIEWS_SAVE_PATH,
+    SQLITE_SAVE_PATH,
+    DriverContext,
+    review_filename,
+)
+from .get_pages import iter_pages, save_page
+from .get_reviews_from_pages import get_review_html, save_review
+from .make_sqlite import insert_review, parse_review_file
+
+DONE = None  # queue sentinel, for when there is nothing more to come.
+
+
+class Pipeline:
+    """Threads and queues connecting the crawl, fetch, and load stages."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        """Store settings and make the queues."""
+        self.args = args
+        self.urls = queue.Queue(maxsize=args.queue_size)
+        self.files = queue.Queue(maxsize=args.queue_size)
+        self.stop = threading.Event()
+        self.fetched = threading.Event()
+        self.metrics = Metrics(args.metrics)
+        self.controller = RateController.from_args(
+            args, max_concurrency=args.workers + 1
+        )
+        self.loaded: set[str] = set()
+
+    def driver(self) -> DriverContext:
+        """Make a driver context sharing the pipeline's controller and metrics."""
+        return DriverContext(
+            headless=self.args.headless,
+            print_=False,
+            lean=self.args.lean,
+            controller=self.controller,
+            metrics=self.metrics,
+        )
+
+    def put(self, q: queue.Queue, item):
+        """Put onto a bounded queue, giving up if the pipeline is stopping."""
+        while not self.stop.is_set():
+            try:
+                return q.put(item, timeout=1)
+            except queue.Full:
+                continue
+
+    def get(self, q: queue.Queue, timeout: float = None):
+        """Get from a queue, returning DONE if the pipeline is stopping or timed out."""
+        deadline = time.monotonic() + (timeout if timeout is not None else math.inf)
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    break
+        return DONE
+
+    def crawl(self):
+        """Requeue urls from saved pages, then crawl the rest and queue their urls."""
+        checkpoint = dict(last_page=0, done=False, new_urls=[])
+        if self.args.checkpoint.exists():
+            checkpoint.update(json.loads(self.args.checkpoint.read_text()))
+
+        known = set()
+        for page_num in range(1, checkpoint["last_page"] + 1):
+            fpath = self.args.pages / f"{page_num}.json"
+            known.update(json.loads(fpath.read_text())["urls"])
+        known.update(checkpoint["new_urls"])
+        for url in known:
+            self.put(self.urls, url)
+
+        # after a finished crawl, new reviews are on the first pages.
+        recrawl = checkpoint["done"]
+        start = 1 if recrawl else checkpoint["last_page"] + 1
+
+        with self.driver() as driver:
+            pages = iter_pages(driver, start=start, base_url=self.args.base_url)
+            for page_num, urls, last in pages:
+                if recrawl:
+                    # the pages have shifted since the crawl, so don't save over it.
+                    new_urls = [url for url in urls if url not in known]
+                    checkpoint["new_urls"] += new_urls
+                else:
+                    new_urls = urls
+                    save_page(self.args.pages, page_num, urls)
+                    checkpoint.update(last_page=page_num, done=last)
+                self.args.checkpoint.write_text(json.dumps(checkpoint))
+
+                known.update(new_urls)
+                for url in new_urls:
+                    self.put(self.urls, url)
+                if self.stop.is_set():
+                    return
+                if recrawl and not new_urls:
+                    print(f"Page {page_num} has no new reviews, done crawling.")
+                    break
+
+        for _ in range(self.args.workers):
+            self.put(self.urls, DONE)
+
+    def fetch(self):
+        """Fetch and save reviews from the url queue, and queue them for loading."""
+        with self.driver() as driver:
+            while True:
+                url = self.get(self.urls)
+                if url is DONE:
+                    break
+                if url in self.loaded:
+                    continue
+                filename = review_filename(self.args.reviews, url)
+                if not filename.exists():
+                    html = get_review_html(driver, url, base_url=self.args.base_url)
+                    save_review(filename, url, html)
+                    self.metrics.count("reviews")
+                self.put(self.files, (url, filename))
+
+    def get_batch(self) -> tuple[list[Path], bool]:
+        """Get up to batch_size new files within batch_seconds, and if that is all."""
+        batch = {}
+        deadline = time.monotonic() + self.args.batch_seconds
+        while len(batch) < self.args.batch_size:
+            item = self.get(self.files, timeout=deadline - time.monotonic())
+            if item is DONE:
+                break
+            url, fpath = item
+            if url not in self.loaded:  # pages can repeat urls, so skip those too.
+                batch[url] = fpath
+        finished = self.stop.is_set() or self.fetched.is_set() and self.files.empty()
+        return list(batch.values()), finished
+
+    def load(self, pool: multiprocessing.pool.Pool):
+        """Parse and insert queued review files in batches, until the fetchers finish."""
+        db = sqlite3.connect(self.args.out, timeout=10000)
+        progress = tqdm(desc="loaded", unit=" reviews")
+
+        finished = False
+        while not finished:
+            batch, finished = self.get_batch()
+            for url, review in pool.map(parse_review_file, batch):
+                insert_review(db, url, review)
+                self.loaded.add(url)
+            db.commit()
+            progress.update(len(batch))
+
+        progress.close()
+        db.close()
+
+    def run(self):
+        """Run all stages until done, or until any of them fails."""
+        self.args.pages.mkdir(parents=True, exist_ok=True)
+        self.args.reviews.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.args.out) as db:
+            sql = "select name from sqlite_master where name = 'reviews'"
+            if db.execute(sql).fetchone() is None:
+                schema.build(db)
+            self.loaded = {
+                row[0] for row in db.execute("select review_url from reviews")
+            }
+
+        def guard(stage):
+            def run_stage(*args):
+                try:
+                    stage(*args)
+                except Exception:
+                    self.stop.set()  # bring down the other stages too.
+                    raise
+
+            return run_stage
+
+        # fork the parsers before starting any threads, so they can't inherit held locks.
+        with multiprocessing.Pool(self.args.procs) as pool, self.metrics:
+            with ThreadPoolExecutor(self.args.workers + 2) as executor:
+                crawl = executor.submit(guard(self.crawl))
+                fetchers = [
+                    executor.submit(guard(self.fetch)) for _ in range(self.args.workers)
+                ]
+                load = executor.submit(guard(self.load), pool)
+
+                for future in fetchers:
+                    future.result()
+                self.fetched.set()
+                crawl.result()
+                load.result()
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--pages",
+        type=Path,
+        help="The path to save the page data.",
+        default=PAGES_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--reviews",
+        type=Path,
+        help="The path to save the review data.",
+        default=REVIEWS_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        help="The path to the sqlite database.",
+        default=SQLITE_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="The path to save the crawl progress, for resuming.",
+        default=PIPELINE_CHECKPOINT_PATH,
+    )
+    parser.add_argument(
+        "--base-url",
+        help="The site to scrape; e.g. a local replay server for testing.",
+        default=BASE_URL,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Max number of browsers to fetch reviews with concurrently.",
+    )
+    parser.add_argument(
+        "--procs",
+        type=lambda x: multiprocessing.cpu_count() if x == "max" else int(x),
+        default=1,
+        help="Number of processes with which to parse reviews.",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=1000,
+        help="Max items waiting between stages.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Max reviews to parse and insert at once.",
+    )
+    parser.add_argument(
+        "--batch-seconds",
+        type=float,
+        default=5.0,
+        help="Max seconds to wait to fill a batch before loading it.",
+    )
+    parser.add_argument(
+        "--headless",
+        help="Option to run the scraper headless",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lean",
+        help="Option to skip images, media, fonts and third party content.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        help="Option to periodically append metrics to this JSONL file.",
+    )
+    RateController.add_args(parser)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    Pipeline(args).run()
+
+    print("\nTesting schema...")
+    with sqlite3.connect(args.out) as db:
+        failures = schema.test(db)
+    assert not failures, f"{len(failures)} tests failed."
+    print("All good!")
@@ -0,0 +1,99 @@
+"""Compare bytes transferred and time-to-selector with and without the lean profile.
+
+Loads the same review urls in a default browser and in a lean one (see DriverContext),
+and reports the per-page means for each.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+from selenium.webdriver.common.by import By
+
+from ._utils import BASE_URL, PAGES_SAVE_PATH, DriverContext
+
+
+def profile(
+    urls: list[str],
+    lean: bool,
+    headless: bool = False,
+    selector: str = ".review-body",
+    settle: float = 2.0,
+) -> dict[str, float]:
+    """Load each url and get the mean seconds to selector and bytes transferred."""
+    seconds, transferred = [], []
+    with DriverContext(
+        headless=headless, print_=False, spare=False, lean=lean, measure=True
+    ) as driver:
+        for url in urls:
+            driver.pop_transferred_bytes()  # clear anything left from before.
+            start = time.perf_counter()
+            driver.navigate(url)
+            driver.driver.find_element(By.CSS_SELECTOR, selector)
+            seconds.append(time.perf_counter() - start)
+
+            # let late requests finish so they are counted against this page.
+            time.sleep(settle)
+            transferred.append(driver.pop_transferred_bytes())
+
+    return dict(
+        seconds=statistics.mean(seconds), kilobytes=statistics.mean(transferred) / 1024
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "urls", nargs="*", help="Review paths to load. Sampled from --in if not set."
+    )
+    parser.add_argument(
+        "--in",
+        dest="in_",
+        type=Path,
+        help="The path to the saved pages data.",
+        default=PAGES_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--sample", type=int, default=10, help="Number of urls to sample from --in."
+    )
+    parser.add_argument(
+        "--headless",
+        help="Option to run the scraper headless",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    urls = args.urls
+    if not urls:
+        assert args.in_.exists()
+        urls = random.sample(
+            [
+                url
+                for fpath in args.in_.glob("*.json")
+                for url in json.loads(fpath.read_text())["urls"]
+            ],
+            args.sample,
+        )
+    urls = [f"{BASE_URL}{url}" for url in urls]
+
+    results = {
+        "default": profile(urls, lean=False, headless=args.headless),
+        "lean": profile(urls, lean=True, headless=args.headless),
+    }
+    for name, result in results.items():
+        print(
+            f"{name}: {result['seconds']:.2f}s to selector,"
+            + f" {result['kilobytes']:.0f}KB transferred per page"
+        )
+
+    saved = 1 - results["lean"]["kilobytes"] / results["default"]["kilobytes"]
+    faster = 1 - results["lean"]["seconds"] / results["default"]["seconds"]
+    print(f"lean profile: {saved:.0%} fewer bytes, {faster:.0%} faster to selector.")
@@ -0,0 +1,286 @@
+"""A local stand-in for pitchfork.com, for testing the scrapers offline.
+
+Serves listing pages at `/reviews/albums/?page=<n>` and review pages at their urls,
+either replayed from the saved pages and reviews data or synthesized. The last listing
+page carries the `end-infinite` marker, like the real site.
+
+Latency and errors can be injected to see how the scrapers behave under load.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import random
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from ._utils import PAGES_SAVE_PATH, REVIEWS_SAVE_PATH, review_filename
+
+REVIEWS_PER_PAGE: int = 12
+
+LISTING_TEMPLATE: str = """<html>
+<head><style>#site-content {{ display: block; }}</style></head>
+<body><div id="site-content">
+{links}
+{end}
+</div></body>
+</html>"""
+
+REVIEW_TEMPLATE: str = """<html>
+<head><title>{url}</title></head>
+<body>{content}</body>
+</html>"""
+
+SYNTHETIC_REVIEW_TEMPLATE: str = """<div id="site-content"><div class="review-body">
+<ul class="artist-list"><li><a href="/artists/{idx}-artist/">Artist {idx}</a></li></ul>
+<ul class="genre-list"><li>Rock</li></ul>
+<ul class="authors-detail"><li>
+<a class="authors-detail__display-name" href="/staff/author/">Author {author}</a>
+</li></ul>
+<time class="pub-date" datetime="{pub_date}"></time>
+<div class="single-album-tombstone">
+<h1 class="single-album-tombstone__review-title">Album {idx}</h1>
+<span class="single-album-tombstone__meta-year"> • {year}</span>
+<span class="score">{score}</span>
+<ul class="labels-list"><li>Label {label}</li></ul>
+</div>
+<div class="review-detail__abstract"><p>An abstract for album {idx}.</p></div>
+<div class="review-detail__text"><div class="contents">
+{paragraphs}
+</div></div>
+</div></div>"""
+
+
+def synthetic_review_html(idx: int) -> str:
+    """Make the site-content HTML of a fake review, which the Review model can parse."""
+    rand = random.Random(idx)
+    pub_date = datetime.datetime(2001, 1, 1) + datetime.timedelta(days=idx % 7300)
+    return SYNTHETIC_REVIEW_TEMPLATE.format(
+        idx=idx,
+        author=rand.randint(0, 100),
+        pub_date=pub_date.isoformat(),
+        year=pub_date.year,
+        score=round(rand.uniform(0, 10), 1),
+        label=rand.randint(0, 200),
+        paragraphs="\n".join(
+            f"<p>Paragraph {p} of synthetic review {idx}.</p>"
+            for p in range(rand.randint(3, 8))
+        ),
+    )
+
+
+class Archive:
+    """Listing pages and review HTML to serve."""
+
+    def __init__(self, pages: dict[int, list[str]], reviews_path: Optional[Path]):
+        """Store the page -> urls mapping and where to find review HTML."""
+        self.pages = pages
+        self.last_page = max(pages)
+        self.reviews_path = reviews_path
+
+    @classmethod
+    def from_saved(
+        cls, pages_path: Path = PAGES_SAVE_PATH, reviews_path: Path = REVIEWS_SAVE_PATH
+    ) -> "Archive":
+        """Replay the saved pages and reviews data."""
+        pages = {}
+        for fpath in pages_path.glob("*.json"):
+            data = json.loads(fpath.read_text())
+            pages[data["page"]] = data["urls"]
+        return cls(pages, reviews_path)
+
+    @classmethod
+    def synthetic(cls, n_pages: int) -> "Archive":
+        """Make up n_pages of synthetic reviews."""
+        pages = {
+            page: [
+                f"/reviews/albums/{idx}-synthetic/"
+                for idx in range((page - 1) * REVIEWS_PER_PAGE, page * REVIEWS_PER_PAGE)
+            ]
+            for page in range(1, n_pages + 1)
+        }
+        return cls(pages, None)
+
+    def get_listing(self, page: int) -> Optional[str]:
+        """Get the HTML of a listing page."""
+        if page not in self.pages:
+            return None
+        return LISTING_TEMPLATE.format(
+            links="\n".join(
+                f'<a class="review__link" href="{url}">{url}</a>'
+                for url in self.pages[page]
+            ),
+            end='<div class="end-infinite"></div>' if page == self.last_page else "",
+        )
+
+    def get_review(self, url: str) -> Optional[str]:
+        """Get the HTML of a review page."""
+        if self.reviews_path is None:
+            if not url.endswith("-synthetic/"):
+                return None
+            idx = int(url.split("/")[-2].split("-")[0])
+            content = synthetic_review_html(idx)
+        else:
+            fpath = review_filename(self.reviews_path, url)
+            if not fpath.exists():
+                return None
+            with gzip.open(fpath, "rb") as f:
+                content = json.load(f)["html"]
+        return REVIEW_TEMPLATE.format(url=url, content=content)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """An HTTP server for an archive, with injected latency and errors."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        archive: Archive,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+    ) -> None:
+        """Bind the server and store settings."""
+        super().__init__(address, ReplayHandler)
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.stats = dict(requests=0, injected_errors=0, not_found=0)
+
+    @property
+    def base_url(self) -> str:
+        """Get the url at which the server can be reached."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str):
+        """Increment one of the server's stats."""
+        with self.lock:
+            self.stats[name] += 1
+
+    def start(self) -> threading.Thread:
+        """Serve in a background thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serve listing and review pages from the server's archive."""
+
+    def do_GET(self):
+        self.server.count("requests")
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if random.random() < self.server.error_rate:
+            self.server.count("injected_errors")
+            return self.send_html(HTTPStatus.SERVICE_UNAVAILABLE, "<html></html>")
+
+        url = urlparse(self.path)
+        if url.path == "/reviews/albums/":
+            page = int(parse_qs(url.query).get("page", ["1"])[0])
+            html = self.server.archive.get_listing(page)
+        else:
+            html = self.server.archive.get_review(url.path)
+
+        if html is None:
+            self.server.count("not_found")
+            return self.send_html(HTTPStatus.NOT_FOUND, "<html></html>")
+        self.send_html(HTTPStatus.OK, html)
+
+    def send_html(self, status: HTTPStatus, html: str):
+        body = html.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Be quiet; the scrapers are the thing being watched."""
+
+
+def add_server_args(parser: argparse.ArgumentParser):
+    """Add arguments to configure the server and its archive to a parser."""
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        help="Option to serve this many pages of synthetic reviews, not saved data.",
+    )
+    parser.add_argument(
+        "--pages",
+        type=Path,
+        help="The path to the saved pages data.",
+        default=PAGES_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--reviews",
+        type=Path,
+        help="The path to the saved review data.",
+        default=REVIEWS_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to delay each response."
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Max extra random seconds to delay each response.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests to fail with a 503.",
+    )
+
+
+def server_from_args(args: argparse.Namespace, port: int = 0) -> ReplayServer:
+    """Make a server from the arguments added by add_server_args."""
+    if args.synthetic:
+        archive = Archive.synthetic(args.synthetic)
+    else:
+        assert args.pages.exists()
+        archive = Archive.from_saved(args.pages, args.reviews)
+
+    return ReplayServer(
+        ("127.0.0.1", port),
+        archive,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8001, help="Port to bind.")
+    add_server_args(parser)
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = server_from_args(args, port=args.port)
+    print(f"Serving {server.archive.last_page} pages on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(server.stats)
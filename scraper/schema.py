@@ -0,0 +1,198 @@
+"""Build and test the dbt models in-process, without shelling out to dbt.
+
+The models in this project use a tiny subset of dbt: `config()` with a materialization
+and an optional post hook, `ref()`, and `this`. That is simple enough to render with a
+few regexes, which makes rebuilds far faster than paying dbt's startup cost.
+
+Likewise, the schema tests are all unique, not_null, or relationships tests; these are
+compiled into one combined query per model instead of one query per test.
+"""
+import argparse
+import re
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from ._utils import DBT_PATH, SQLITE_SAVE_PATH
+
+CONFIG_PATTERN = re.compile(r"\{\{\s*config\((?P<args>.*?)\)\s*\}\}", re.DOTALL)
+MATERIALIZED_PATTERN = re.compile(r"materialized\s*=\s*'(?P<value>\w+)'")
+POST_HOOK_PATTERN = re.compile(r"post_hook\s*=\s*'(?P<value>[^']*)'")
+REF_PATTERN = re.compile(r"\{\{\s*ref\('(?P<name>\w+)'\)(?:\.name)?\s*\}\}")
+THIS_PATTERN = re.compile(r"\{\{\s*this(?:\.name)?\s*\}\}")
+TEST_REF_PATTERN = re.compile(r"ref\('(?P<name>\w+)'\)")
+JINJA_PATTERN = re.compile(r"\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\}", re.DOTALL)
+
+
+@dataclass
+class Model:
+    """A dbt model, rendered to plain sql."""
+
+    name: str
+    materialized: str
+    sql: str
+    post_hook: Optional[str]
+    refs: list[str]
+
+    @classmethod
+    def from_file(cls, path: Path) -> "Model":
+        """Parse and render a model file."""
+        name = path.stem
+        raw = path.read_text()
+        config = CONFIG_PATTERN.search(raw)
+        assert config is not None, f"No config in {path}"
+        materialized = MATERIALIZED_PATTERN.search(config["args"])
+        assert materialized is not None, f"No materialization in {path}"
+        post_hook = POST_HOOK_PATTERN.search(config["args"])
+
+        def render(sql: str) -> str:
+            sql = REF_PATTERN.sub(lambda m: m["name"], sql)
+            sql = THIS_PATTERN.sub(name, sql)
+            unsupported = JINJA_PATTERN.search(sql)
+            if unsupported:
+                raise ValueError(f"Unsupported jinja in {path}: {unsupported[0]}")
+            return sql
+
+        return cls(
+            name=name,
+            materialized=materialized["value"],
+            sql=render(CONFIG_PATTERN.sub("", raw)),
+            post_hook=render(post_hook["value"]) if post_hook else None,
+            refs=[m["name"] for m in REF_PATTERN.finditer(raw)],
+        )
+
+    def create(self, db: sqlite3.Connection):
+        """Create the model in the db, replacing anything already there."""
+        if self.materialized == "view":
+            db.execute(f"""drop view if exists "{self.name}" """)
+            db.execute(f"""create view "{self.name}" as {self.sql}""")
+        elif self.materialized == "create":
+            db.execute(f"""drop table if exists "{self.name}" """)
+            db.execute(self.sql)
+        else:
+            raise ValueError(f"Unsupported materialization: {self.materialized}")
+
+        if self.post_hook:
+            db.execute(self.post_hook)
+
+
+def load_models(path: Path = DBT_PATH) -> list[Model]:
+    """Load the models, sorted such that refs come before the models using them."""
+    files = sorted((path / "models").glob("*.sql"))
+    assert (
+        files
+    ), f"No models in {path / 'models'}; run from the repo root or pass --project-dir."
+    models = {model.name: model for model in map(Model.from_file, files)}
+
+    ordered, seen = [], set()
+
+    def visit(name: str, stack: tuple[str, ...] = ()):
+        assert name not in stack, f"Cycle in model refs: {stack + (name,)}"
+        if name in seen:
+            return
+        for ref in models[name].refs:
+            visit(ref, stack + (name,))
+        seen.add(name)
+        ordered.append(models[name])
+
+    for name in models:
+        visit(name)
+    return ordered
+
+
+def build(db: sqlite3.Connection, path: Path = DBT_PATH):
+    """Create all of the models in the db."""
+    for model in load_models(path):
+        print(f"Creating {model.materialized} {model.name}")
+        model.create(db)
+    db.commit()
+
+
+def compile_tests(path: Path = DBT_PATH) -> dict[str, str]:
+    """Compile the schema tests into one query per model.
+
+    Each query returns one row, with a column per test containing the number of
+    failing rows for that test.
+    """
+    schema = yaml.safe_load((path / "models" / "schema.yml").read_text())
+    queries = {}
+    for model in schema["models"]:
+        name = model["name"]
+        tests = []
+        for column in model.get("columns", []):
+            col = f'''"{column['name']}"'''
+            for test in column.get("tests", []):
+                if test == "unique":
+                    sql = f"""count({col}) - count(distinct {col})"""
+                    tests.append((f"unique_{name}_{column['name']}", sql))
+                elif test == "not_null":
+                    sql = f"""coalesce(sum({col} is null), 0)"""
+                    tests.append((f"not_null_{name}_{column['name']}", sql))
+                elif "relationships" in test:
+                    to = TEST_REF_PATTERN.match(test["relationships"]["to"])["name"]
+                    field = test["relationships"]["field"]
+                    sql = f"""
+                        coalesce(sum(
+                            {col} is not null and not exists (
+                                select 1 from "{to}" as parent
+                                where parent."{field}" = "{name}".{col}
+                            )
+                        ), 0)
+                    """
+                    test_name = f"relationships_{name}_{column['name']}__{field}__{to}"
+                    tests.append((test_name, sql))
+                else:
+                    raise ValueError(f"Unsupported test on {name}: {test}")
+
+        if tests:
+            cols_sql = ", ".join(f'{sql} as "{test_name}"' for test_name, sql in tests)
+            queries[name] = f"""select {cols_sql} from "{name}" """
+
+    return queries
+
+
+def test(db: sqlite3.Connection, path: Path = DBT_PATH) -> dict[str, int]:
+    """Run the schema tests, returning the number of failures per failed test."""
+    failures = {}
+    for name, sql in compile_tests(path).items():
+        cur = db.execute(sql)
+        results = zip([i[0] for i in cur.description], cur.fetchone())
+        for test_name, failed in results:
+            status = "PASS" if failed == 0 else f"FAIL {failed}"
+            print(f"{status} {test_name}")
+            if failed:
+                failures[test_name] = failed
+    return failures
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["run", "test"])
+    parser.add_argument(
+        "--out",
+        type=Path,
+        help="The path to the sqlite database.",
+        default=SQLITE_SAVE_PATH,
+    )
+    parser.add_argument(
+        "--project-dir",
+        type=Path,
+        help="The path to the dbt project.",
+        default=DBT_PATH,
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with sqlite3.connect(args.out) as db:
+        if args.command == "run":
+            build(db, args.project_dir)
+        elif args.command == "test":
+            failures = test(db, args.project_dir)
+            assert not failures, f"{len(failures)} tests failed."
@@ -0,0 +1,293 @@
+"""Serve common read-only lookups against the sqlite database as JSON over HTTP.
+
+Queries are fixed strings, so each pooled connection prepares them once and reuses the
+statement from its cache thereafter. Results are held in an LRU cache which is cleared
+(and the pool reconnected) whenever the database file is rebuilt.
+
+Routes look like `/<query>?value=<value>&limit=<limit>`, e.g.:
+
+    /artist?value=radiohead
+    /genre?value=Rock&limit=10
+    /top?limit=25
+"""
+import argparse
+import functools
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Generator, Optional
+from urllib.parse import parse_qs, urlparse
+
+from ._utils import SQLITE_SAVE_PATH
+
+DEFAULT_LIMIT: int = 100
+MAX_LIMIT: int = 1000
+
+FLAT_COLUMNS: str = """
+    review_url, artists, title, score, best_new_music, best_new_reissue, authors,
+    genres, labels, pub_date, release_year
+"""
+STANDARD_COLUMNS: str = """
+    review_url, artists, title, score, best_new_music, authors, genres, labels,
+    pub_date, release_year
+"""
+
+# name -> (sql, whether the query needs a value)
+QUERIES: dict[str, tuple[str, bool]] = {
+    "review": (
+        f"""
+        select {FLAT_COLUMNS}, body from reviews_flat
+        where review_url = :value
+        """,
+        True,
+    ),
+    "artist": (
+        f"""
+        select {FLAT_COLUMNS} from reviews_flat
+        where review_url in (
+            select review_url from artist_review_map where artist_id = :value
+        )
+        order by pub_date desc limit :limit
+        """,
+        True,
+    ),
+    "author": (
+        f"""
+        select {FLAT_COLUMNS} from reviews_flat
+        where review_url in (
+            select review_url from author_review_map where author = :value
+        )
+        order by pub_date desc limit :limit
+        """,
+        True,
+    ),
+    "genre": (
+        f"""
+        select {FLAT_COLUMNS} from reviews_flat
+        where review_url in (
+            select review_url from genre_review_map where genre = :value
+        )
+        order by pub_date desc limit :limit
+        """,
+        True,
+    ),
+    "label": (
+        f"""
+        select {FLAT_COLUMNS} from reviews_flat
+        where review_url in (
+            select tombstones.review_url
+            from tombstones
+            inner join tombstone_label_map as label_map
+                on tombstones.review_tombstone_id = label_map.review_tombstone_id
+            where label_map.label = :value
+        )
+        order by pub_date desc limit :limit
+        """,
+        True,
+    ),
+    "year": (
+        f"""
+        select {FLAT_COLUMNS} from reviews_flat
+        where review_url in (
+            select tombstones.review_url
+            from tombstones
+            inner join tombstone_release_year_map as year_map
+                on tombstones.review_tombstone_id = year_map.review_tombstone_id
+            where year_map.release_year = cast(:value as int)
+        )
+        order by pub_date desc limit :limit
+        """,
+        True,
+    ),
+    "top": (
+        f"""
+        select {STANDARD_COLUMNS} from standard_reviews_flat
+        order by score desc, pub_date desc limit :limit
+        """,
+        False,
+    ),
+}
+
+
+class ConnectionPool:
+    """A fixed-size pool of read-only sqlite connections.
+
+    Connections are tagged with the generation in which they were opened; calling
+    reset() bumps the generation so that stale connections are reopened on checkout.
+    """
+
+    def __init__(self, path: Path, size: int = 4) -> None:
+        """Open the pool."""
+        self.path = path
+        self.generation = 0
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put((self.generation, self.connect()))
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a read-only connection to the database."""
+        db = sqlite3.connect(
+            f"file:{self.path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=len(QUERIES) * 2,
+        )
+        db.row_factory = sqlite3.Row
+        return db
+
+    def reset(self):
+        """Mark all open connections as stale."""
+        self.generation += 1
+
+    @contextmanager
+    def connection(self) -> Generator[sqlite3.Connection, None, None]:
+        """Check a connection out of the pool, reopening it if stale."""
+        generation, db = self.connections.get()
+        try:
+            if generation != self.generation:
+                db.close()
+                generation, db = self.generation, self.connect()
+            yield db
+        finally:
+            self.connections.put((generation, db))
+
+
+class QueryService:
+    """Run named queries through the pool, caching results per database build."""
+
+    def __init__(self, path: Path, pool_size: int = 4, cache_size: int = 1024) -> None:
+        """Set up the pool and cache."""
+        self.path = path
+        self.pool = ConnectionPool(path, size=pool_size)
+        self.lock = threading.Lock()
+        self.build_ts = self.get_build_ts()
+        self.run_cached = functools.lru_cache(maxsize=cache_size)(self.run)
+
+    def get_build_ts(self) -> Optional[int]:
+        """Get the build timestamp of the database file, if it exists."""
+        try:
+            return self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def check_build(self) -> int:
+        """Clear the cache and reconnect if the database has been rebuilt.
+
+        Returns the build timestamp to query under.
+        """
+        build_ts = self.get_build_ts()
+        # while the db is being rebuilt it may be missing; keep serving the old one.
+        if build_ts is None or build_ts == self.build_ts:
+            return self.build_ts
+        with self.lock:
+            if build_ts != self.build_ts:
+                print(f"Database rebuilt at {build_ts}; clearing cache.")
+                self.pool.reset()
+                self.run_cached.cache_clear()
+                self.build_ts = build_ts
+        return self.build_ts
+
+    def run(
+        self, name: str, value: Optional[str], limit: int, build_ts: int
+    ) -> list[dict[str, Any]]:
+        """Run a named query without caching.
+
+        build_ts is only part of the cache key, so that a query which was running while
+        the db was rebuilt can't cache its stale rows for the new build.
+        """
+        sql, _ = QUERIES[name]
+        with self.pool.connection() as db:
+            rows = db.execute(sql, dict(value=value, limit=limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def query(
+        self, name: str, value: Optional[str] = None, limit: int = DEFAULT_LIMIT
+    ) -> tuple[list[dict[str, Any]], int]:
+        """Run a named query through the cache, returning rows and their build."""
+        if name not in QUERIES:
+            raise KeyError(f"Unknown query: {name}")
+        if QUERIES[name][1] and value is None:
+            raise ValueError(f"Query {name} needs a value.")
+        if limit < 1:
+            raise ValueError("The limit must be at least 1.")
+        build_ts = self.check_build()
+        return self.run_cached(name, value, min(limit, MAX_LIMIT), build_ts), build_ts
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Route GET requests to the query service on the server."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        name = url.path.strip("/")
+        try:
+            rows, build_ts = self.server.service.query(
+                name,
+                value=params.get("value", [None])[0],
+                limit=int(params.get("limit", [DEFAULT_LIMIT])[0]),
+            )
+        except KeyError as e:
+            return self.send_json(HTTPStatus.NOT_FOUND, {"error": e.args[0]})
+        except ValueError as e:
+            return self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        except sqlite3.OperationalError as e:
+            # e.g. the db was swapped out mid-rebuild; it's worth trying again.
+            return self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)})
+
+        self.send_json(
+            HTTPStatus.OK,
+            {"query": name, "build_ts": build_ts, "rows": rows},
+        )
+
+    def send_json(self, status: HTTPStatus, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--in",
+        dest="in_",
+        type=Path,
+        help="The path to the sqlite database.",
+        default=SQLITE_SAVE_PATH,
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind.")
+    parser.add_argument(
+        "--pool-size", type=int, default=4, help="Number of sqlite connections."
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=1024, help="Number of results to cache."
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    assert args.in_.exists()
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.service = QueryService(
+        args.in_, pool_size=args.pool_size, cache_size=args.cache_size
+    )
+    print(f"Serving {args.in_} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,274 @@
+"""Build a TF-IDF index over review bodies and query it for similar reviews.
+
+The index is a set of files in --index:
+
+- counts.npz: sparse matrix of raw token counts; one row per review.
+- tfidf.npz: the L2-normalized TF-IDF matrix derived from the counts.
+- vocabulary.json: list of tokens; the position of a token is its column.
+- reviews.json: review urls and body hashes; the position of a url is its row.
+
+Builds are incremental: only reviews which are new (or whose body changed) since the
+last build are tokenized. IDF weights are recomputed from the counts on every build,
+which is cheap compared to tokenization. Queries use the saved TF-IDF matrix as is.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import re
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+from tqdm import tqdm
+
+from ._utils import SQLITE_SAVE_PATH, TFIDF_SAVE_PATH
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def tokenize(body: str) -> Counter:
+    """Count the tokens in a review body."""
+    return Counter(TOKEN_PATTERN.findall(body.lower()))
+
+
+def body_hash(body: str) -> str:
+    """Hash a review body, to detect changes between builds."""
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+class TfidfIndex:
+    """A sparse TF-IDF matrix over review bodies, with its vocabulary."""
+
+    def __init__(
+        self,
+        counts: sparse.csr_matrix,
+        vocabulary: list[str],
+        urls: list[str],
+        hashes: list[str],
+        tfidf: sparse.csr_matrix = None,
+    ) -> None:
+        """Store the counts and the TF-IDF matrix, deriving it if not given."""
+        self.counts = counts
+        self.vocabulary = vocabulary
+        self.urls = urls
+        self.hashes = hashes
+        self.rows = {url: idx for idx, url in enumerate(urls)}
+        self.tfidf = tfidf if tfidf is not None else self.weight(counts)
+
+    @staticmethod
+    def weight(counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Apply sublinear TF, smoothed IDF, and L2 row normalization."""
+        n_rows, n_cols = counts.shape
+        tf = counts.astype(np.float32)
+        tf.data = 1 + np.log(tf.data)
+
+        doc_freq = np.bincount(tf.indices, minlength=n_cols)
+        idf = np.log((1 + n_rows) / (1 + doc_freq)) + 1
+        tfidf = tf @ sparse.diags(idf.astype(np.float32))
+
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ tfidf, dtype=np.float32)
+
+    @classmethod
+    def empty(cls) -> "TfidfIndex":
+        """Make an index with no reviews in it."""
+        return cls(sparse.csr_matrix((0, 0), dtype=np.int32), [], [], [])
+
+    @classmethod
+    def load(cls, path: Path) -> "TfidfIndex":
+        """Load a saved index."""
+        reviews = json.loads((path / "reviews.json").read_text())
+        return cls(
+            counts=sparse.load_npz(path / "counts.npz").tocsr(),
+            vocabulary=json.loads((path / "vocabulary.json").read_text()),
+            urls=reviews["urls"],
+            hashes=reviews["hashes"],
+            tfidf=sparse.load_npz(path / "tfidf.npz").tocsr(),
+        )
+
+    def save(self, path: Path):
+        """Save the index, overwriting what was there."""
+        path.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(path / "counts.npz", self.counts)
+        sparse.save_npz(path / "tfidf.npz", self.tfidf)
+        (path / "vocabulary.json").write_text(json.dumps(self.vocabulary))
+        (path / "reviews.json").write_text(
+            json.dumps({"urls": self.urls, "hashes": self.hashes})
+        )
+
+    def update(
+        self, reviews: list[tuple[str, str]], procs: int = 1, progress: bool = True
+    ) -> "TfidfIndex":
+        """Make a new index from (url, body) pairs, reusing unchanged rows.
+
+        Reviews not in the given list are dropped from the index; only new or changed
+        bodies are tokenized.
+        """
+        keep, todo = [], []
+        for url, body in reviews:
+            hash_ = body_hash(body)
+            idx = self.rows.get(url)
+            if idx is not None and self.hashes[idx] == hash_:
+                keep.append((url, hash_, idx))
+            else:
+                todo.append((url, hash_, body))
+
+        with multiprocessing.Pool(procs) as pool:
+            bodies = (body for _, _, body in todo)
+            tokenized = pool.imap(tokenize, bodies, chunksize=64)
+            if progress:
+                tokenized = tqdm(tokenized, total=len(todo))
+            tokenized = list(tokenized)
+
+        # extend the vocabulary with any new tokens, so old columns keep their ids.
+        vocabulary = list(self.vocabulary)
+        columns = {token: idx for idx, token in enumerate(vocabulary)}
+        indptr, indices, data = [0], [], []
+        for counter in tokenized:
+            for token, count in counter.items():
+                if token not in columns:
+                    columns[token] = len(vocabulary)
+                    vocabulary.append(token)
+                indices.append(columns[token])
+                data.append(count)
+            indptr.append(len(indices))
+
+        n_cols = len(vocabulary)
+        new_counts = sparse.csr_matrix(
+            (
+                np.array(data, dtype=np.int32),
+                np.array(indices, dtype=np.int32),
+                np.array(indptr, dtype=np.int64),
+            ),
+            shape=(len(todo), n_cols),
+        )
+        old_counts = self.counts[[idx for _, _, idx in keep]]
+        old_counts.resize((len(keep), n_cols))
+
+        return TfidfIndex(
+            counts=sparse.vstack([old_counts, new_counts], format="csr"),
+            vocabulary=vocabulary,
+            urls=[url for url, _, _ in keep] + [url for url, _, _ in todo],
+            hashes=[hash_ for _, hash_, _ in keep] + [hash_ for _, hash_, _ in todo],
+        )
+
+    def similarities(self, rows: list[int], batch_size: int = 256):
+        """Yield (row, similarity vector) pairs, computed in batched sparse products."""
+        for pos in range(0, len(rows), batch_size):
+            batch = rows[pos : pos + batch_size]
+            sims = (self.tfidf[batch] @ self.tfidf.T).toarray()
+            yield from zip(batch, sims)
+
+    def top_k(
+        self, urls: list[str], k: int = 10, batch_size: int = 256
+    ) -> dict[str, list[tuple[str, float]]]:
+        """Get up to k most similar reviews for each url, excluding itself.
+
+        Reviews with nothing in common with the url are left out, so there may be fewer.
+        """
+        unknown = [url for url in urls if url not in self.rows]
+        assert not unknown, f"Not in the index: {', '.join(unknown)}"
+        result = {}
+        rows = [self.rows[url] for url in urls]
+        k = min(k, len(self.urls) - 1)
+        for row, sims in self.similarities(rows, batch_size=batch_size):
+            sims[row] = -1
+            best = np.argpartition(-sims, k)[:k]
+            best = best[np.argsort(-sims[best])]
+            result[self.urls[row]] = [
+                (self.urls[i], float(sims[i])) for i in best if sims[i] > 0
+            ]
+        return result
+
+    def near_duplicates(self, min_similarity: float = 0.8, batch_size: int = 256):
+        """Yield (url, url, similarity) for all pairs above the threshold."""
+        rows = list(range(len(self.urls)))
+        for row, sims in self.similarities(rows, batch_size=batch_size):
+            # only look above the diagonal so each pair is reported once.
+            (matches,) = np.nonzero(sims[row + 1 :] >= min_similarity)
+            for i in matches + row + 1:
+                yield self.urls[row], self.urls[i], float(sims[i])
+
+
+def parse_args() -> argparse.Namespace:
+    """Make the parser for the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--index",
+        type=Path,
+        help="The path to the saved TF-IDF index.",
+        default=TFIDF_SAVE_PATH,
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build or update the index.")
+    build.add_argument(
+        "--in",
+        dest="in_",
+        type=Path,
+        help="The path to the sqlite database.",
+        default=SQLITE_SAVE_PATH,
+    )
+    build.add_argument(
+        "--procs",
+        type=lambda x: multiprocessing.cpu_count() if x == "max" else int(x),
+        default=1,
+        help="Number of processes with which to tokenize.",
+    )
+    build.add_argument(
+        "--full",
+        action="store_true",
+        help="Option to ignore the existing index and tokenize everything.",
+    )
+
+    query = subparsers.add_parser("query", help="Find reviews similar to others.")
+    query.add_argument("urls", nargs="+", help="Review urls to query.")
+    query.add_argument("-k", type=int, default=10, help="Number of results per url.")
+
+    duplicates = subparsers.add_parser(
+        "duplicates", help="List pairs of reviews with near-duplicate text."
+    )
+    duplicates.add_argument(
+        "--min-similarity",
+        type=float,
+        default=0.8,
+        help="Cosine similarity at which a pair is reported.",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.command == "build":
+        assert args.in_.exists()
+        if args.full or not (args.index / "reviews.json").exists():
+            index = TfidfIndex.empty()
+        else:
+            index = TfidfIndex.load(args.index)
+
+        with sqlite3.connect(args.in_) as db:
+            reviews = db.execute("select review_url, body from reviews").fetchall()
+
+        print(f"Indexing {len(reviews)} reviews...")
+        index = index.update(reviews, procs=args.procs)
+        index.save(args.index)
+        print(f"Saved {index.tfidf.shape} matrix to {args.index}.")
+
+    elif args.command == "query":
+        index = TfidfIndex.load(args.index)
+        for url, similar in index.top_k(args.urls, k=args.k).items():
+            print(url)
+            for other, sim in similar:
+                print(f"    {sim:.3f}  {other}")
+
+    elif args.command == "duplicates":
+        index = TfidfIndex.load(args.index)
+        for url, other, sim in index.near_duplicates(args.min_similarity):
+            print(f"{sim:.3f}\t{url}\t{other}")
@@ -1,21 +1,51 @@
 """Run spot checks on review body content.
 
-There is too much of this and too muchn weird encoding to do in full; so this file 
-contains manually configured checks for specific reviews.
+There is too much weird encoding to check every body against the source by hand; so this
+file contains manually configured checks for specific reviews.
 
 This can be added too eternally; so far I have added a few reviews from very different
 period of Pitchfork writing. The idea was to first pick reviews from those periods, 
 look at the HTML, and make sure I check stuff that looks strange. It uncovered SEVERAL
 bugs in the scraper.
+
+The manual checks are complemented by a scan of the entire reviews and tombstones tables
+(--scan) for invariants which should hold for every row; e.g., no leftover lookalike
+quotes and spaces which sanitize_paragraph does not replace.
 """
 import argparse
+import multiprocessing
 import sqlite3
+from collections import defaultdict
 from pathlib import Path
+from typing import Generator
 from tqdm import tqdm
 from ._utils import SQLITE_SAVE_PATH
 
 from dataclasses import dataclass
 
+# characters which sanitize_paragraph does not replace, but probably should.
+LEFTOVER_CHARS: dict[str, str] = {
+    "\u201A": "low single quote",
+    "\u201E": "low double quote",
+    "\u201B": "reversed single quote",
+    "\u201F": "reversed double quote",
+    "\u2032": "prime",
+    "\u2033": "double prime",
+    "\u202F": "narrow non breaking space",
+    "\u2007": "figure space",
+    "\u2009": "thin space",
+    "\u200B": "zero width space",
+    "\uFEFF": "byte order mark",
+    "\uFFFD": "replacement character",
+}
+
+# name -> sql returning the review_url of tombstones which violate the invariant.
+TOMBSTONE_INVARIANTS: dict[str, str] = {
+    "score out of bounds": "score < 0 or score > 10",
+    "empty title": "trim(title) = ''",
+    "negative picker index": "picker_index < 0",
+}
+
 
 @dataclass
 class Check:
@@ -28,14 +58,7 @@ class Check:
     parargraphs: int
     snippets: list[str]
 
-    def do_check(self, cur: sqlite3.Cursor):
-        sql = """select body from reviews where review_url = ?"""
-        cur.execute(sql, (self.url,))
-        body = cur.fetchone()
-        assert body is not None, f"{self.url} not found in db."
-
-        body = body[0]
-
+    def check_body(self, body: str):
         paragraphs = body.count("\n\n") + 1  # +1 for final paragraph
         assert (
             paragraphs == self.parargraphs
@@ -101,6 +124,75 @@ CHECKS: list[Check] = [
 ]
 
 
+def run_checks(cur: sqlite3.Cursor, checks: list[Check]):
+    """Run many checks, fetching all of the bodies in one query."""
+    qs_sql = ", ".join(["?"] * len(checks))
+    sql = f"""select review_url, body from reviews where review_url in ({qs_sql})"""
+    bodies = dict(cur.execute(sql, [check.url for check in checks]).fetchall())
+    for check in checks:
+        assert check.url in bodies, f"{check.url} not found in db."
+        check.check_body(bodies[check.url])
+
+
+def scan_bodies(rows: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """Get (invariant, review_url) for each violation in a batch of review bodies."""
+    violations = []
+    for url, body in rows:
+        # empty <p> tags are kept as empty paragraphs, so those don't count.
+        paragraphs = [para for para in body.split("\n\n") if para]
+        if not paragraphs:
+            violations.append(("no paragraphs", url))
+            continue
+
+        for char, name in LEFTOVER_CHARS.items():
+            if char in body:
+                violations.append((f"leftover {name}", url))
+
+        if any(para != para.strip() for para in paragraphs):
+            violations.append(("unstripped paragraph", url))
+
+    return violations
+
+
+def batches(cur: sqlite3.Cursor, size: int) -> Generator[list, None, None]:
+    """Stream the results of an executed cursor in batches."""
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def scan(path: Path, procs: int = 1, batch_size: int = 500) -> dict:
+    """Scan the whole db for invariant violations, returning {invariant: [urls]}."""
+    violations = defaultdict(list)
+
+    # the pool feeds batches to workers from another thread.
+    db = sqlite3.connect(path, check_same_thread=False)
+
+    # tombstone invariants are simple enough to run as one scan in sqlite.
+    cases_sql = ", ".join(
+        f"""case when {sql} then '{name}' end"""
+        for name, sql in TOMBSTONE_INVARIANTS.items()
+    )
+    where_sql = " or ".join(f"({sql})" for sql in TOMBSTONE_INVARIANTS.values())
+    sql = f"""select review_url, {cases_sql} from tombstones where {where_sql}"""
+    for review_url, *names in db.execute(sql):
+        for name in filter(None, names):
+            violations[name].append(review_url)
+
+    n_reviews = db.execute("""select count(*) from reviews""").fetchone()[0]
+    cur = db.execute("""select review_url, body from reviews""")
+    with multiprocessing.Pool(procs) as pool:
+        results = pool.imap_unordered(scan_bodies, batches(cur, batch_size))
+        for batch in tqdm(results, total=-(-n_reviews // batch_size)):
+            for name, review_url in batch:
+                violations[name].append(review_url)
+
+    db.close()
+    return dict(violations)
+
+
 def parse_args() -> argparse.Namespace:
     """Make the parser for the command line arguments."""
     parser = argparse.ArgumentParser(description=__doc__)
@@ -111,6 +203,17 @@ def parse_args() -> argparse.Namespace:
         help="The path to save the sqlite database.",
         default=SQLITE_SAVE_PATH,
     )
+    parser.add_argument(
+        "--scan",
+        action="store_true",
+        help="Option to also scan all reviews and tombstones for invariant violations.",
+    )
+    parser.add_argument(
+        "--procs",
+        type=lambda x: multiprocessing.cpu_count() if x == "max" else int(x),
+        default=1,
+        help="Number of processes with which to run the scan.",
+    )
     args = parser.parse_args()
     return args
 
@@ -118,6 +221,14 @@ def parse_args() -> argparse.Namespace:
 if __name__ == "__main__":
     args = parse_args()
     with sqlite3.connect(args.in_) as db:
-        cur = db.cursor()
-        for check in tqdm(CHECKS):
-            check.do_check(cur)
+        print(f"Running {len(CHECKS)} spot checks...")
+        run_checks(db.cursor(), CHECKS)
+
+        if args.scan:
+            print("Scanning for invariant violations...")
+            violations = scan(args.in_, procs=args.procs)
+            for name, urls in violations.items():
+                print(f"{name}: {len(urls)} violations, e.g. {urls[:3]}")
+            assert not violations, "Invariant violations found."
+
+    print("All good!")